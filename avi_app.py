@@ -1,140 +1,69 @@
-import os
 import streamlit as st
-import pandas as pd
-from docx import Document
-from docx.shared import Pt
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-from tempfile import NamedTemporaryFile
-import base64
 import re
-import math
-import geopandas as gpd
+import pandas as pd
 import zipfile
-import shutil
-from tempfile import mkdtemp
-import tempfile
-from pathlib import Path
 import datetime
+import io
 from urllib.parse import quote
 
-
-# --- Load TDA tables ---
-@st.cache_data
-def load_tda(region):
-    path = f"{region.upper()}_TDA.xlsx"  # Looks for file in same directory as avi_app.py
-    return pd.read_excel(path)
+from avi_calc import (
+    StandResult,
+    build_stand_inputs,
+    calculate_avi_and_volumes,
+    calculate_avi_and_volumes_batch,
+    has_stand_attributes,
+    StandLog,
+    polygon_area_ha,
+    species_names,
+)
+from footprints import (
+    REGION_LAYER_FOLDER,
+    FOOTPRINT_WORKERS,
+    FootprintCache,
+    FootprintPool,
+    DissolverBatch,
+    LayerWarmup,
+    ats_code_to_p3,
+    find_region_layer_path,
+    footprint_cache_key,
+    footprint_layers_key,
+    get_region_folder_files,
+    open_ats_layer,
+    parse_ats_text,
+    read_natural_regions_store,
+    _layer_cache_key,
+)
+from report import (
+    DEFAULT_WAIVER_JUSTIFICATION,
+    REPORT_TEMPLATE_PATH,
+    VEGETATION_TYPES,
+    ReportTemplate,
+    bulk_report_jobs,
+    disposition_rows,
+    read_disposition_table,
+    render_reports_zip,
+    report_filename,
+    salvage_report_fields,
+    stand_dispositions,
+    totals_by_disposition,
+)
+from workspace import sweep_expired
 
 
 # --- Species mapping & choices ---
-species_names = {
-    "Sw": "White spruce",
-    "Sb": "Black spruce",
-    "P": "Pine",
-    "Fb": "Balsam fir",
-    "Fd": "Douglas fir",
-    "Lt": "Larch",
-    "Aw": "Aspen",
-    "Pb": "Balsam poplar",
-    "Bw": "White birch",
-}
-
 species_codes = sorted(species_names)
 species_choices = [f"{code} ({species_names[code]})" for code in species_codes]
 
-# ← For TDA logic:
-conifers = {"Sw", "Sb", "P", "Fb", "Fd", "Lt"}
-deciduous = {"Aw", "Pb", "Bw"}
-
-
-# --- Natural Region spatial lookup ---
-# Put the Alberta Natural Regions/Subregions shapefile files in your repo here:
-# Regions/
-#   REGIONS.shp
-#   REGIONS.shx
-#   REGIONS.dbf
-#   REGIONS.prj
-#   REGIONS.cpg
-#
-# This loader is case-flexible. It will use REGIONS.shp, regions.shp,
-# or the first .shp it finds inside the Regions folder.
-REGION_LAYER_FOLDER = Path(__file__).resolve().parent / "Regions"
-
-
-def find_region_layer_path():
-    """Find the Natural Regions shapefile in the repo, regardless of filename case."""
-    if not REGION_LAYER_FOLDER.exists():
-        return None
-
-    preferred_names = ["REGIONS.shp", "regions.shp", "Regions.shp"]
-    for name in preferred_names:
-        candidate = REGION_LAYER_FOLDER / name
-        if candidate.exists():
-            return candidate
-
-    shp_files = sorted(REGION_LAYER_FOLDER.glob("*.shp"))
-    if shp_files:
-        return shp_files[0]
-
-    return None
-
-
-def get_region_folder_files():
-    """Small debug helper for Streamlit Cloud path issues."""
-    if not REGION_LAYER_FOLDER.exists():
-        return []
-    return sorted([p.name for p in REGION_LAYER_FOLDER.iterdir()])
-
 
-def _safe_union(geo_series):
-    """Works with both older and newer GeoPandas versions."""
-    try:
-        return geo_series.union_all()
-    except AttributeError:
-        return geo_series.unary_union
-
-
-def _clean_geometries(gdf):
-    """Fix simple invalid geometries and remove empty/null geometries."""
-    gdf = gdf.copy()
-    gdf = gdf[gdf.geometry.notna()]
-    gdf = gdf[~gdf.geometry.is_empty]
-    if gdf.empty:
-        return gdf
-
-    try:
-        gdf["geometry"] = gdf.geometry.make_valid()
-    except Exception:
-        gdf["geometry"] = gdf.geometry.buffer(0)
-
-    gdf = gdf[gdf.geometry.notna()]
-    gdf = gdf[~gdf.geometry.is_empty]
-    return gdf
-
-
-def _find_field(gdf, possible_names):
-    """Find a field ignoring case."""
-    lower_lookup = {c.lower(): c for c in gdf.columns}
-    for name in possible_names:
-        if name.lower() in lower_lookup:
-            return lower_lookup[name.lower()]
-    return None
-
-
-def normalize_tda_region_name(nrname):
+# --- Reference layers (Natural Regions, ATS) ---
+# Lookups and processing live in footprints.py; the app caches the loaded layers per process.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_natural_regions_cached(path_str, mtime_ns, size):
     """
-    Converts Alberta NRNAME text into the simplified TDA table region names used by this app.
-    Add more mappings here if you later add more TDA tables.
+    Reads and prepares the Natural Regions layer once per process.
+    Shared by every session on the server, so reruns never touch the shapefile.
     """
-    text = str(nrname or "").lower()
-
-    if "boreal" in text:
-        return "Boreal"
-    if "foothill" in text:
-        return "Foothills"
-
-    # Outside current TDA options. Keep the original name so you can see it.
-    return str(nrname or "").strip()
+    return read_natural_regions_store(path_str)
 
 
 def load_natural_regions_layer():
@@ -142,7 +71,7 @@ def load_natural_regions_layer():
     Loads the Alberta Natural Regions/Subregions layer from the repo.
 
     Returns:
-        natural_regions_gdf, path_used, error_message
+        natural_regions_store, path_used, error_message
     """
     region_path = find_region_layer_path()
 
@@ -155,380 +84,54 @@ def load_natural_regions_layer():
         )
 
     try:
-        gdf = gpd.read_file(region_path)
-        return gdf, str(region_path), ""
+        store = _load_natural_regions_cached(*_layer_cache_key(region_path))
+        return store, str(region_path), ""
     except Exception as e:
         return None, str(region_path), f"{type(e).__name__}: {e}"
 
 
-def get_natural_region_overlap(project_gdf, regions_gdf):
-    """
-    Returns the natural region/subregion that has the largest spatial overlap
-    with the uploaded project shapefile.
-    """
-    empty_result = {
-        "region_raw": "",
-        "subregion_raw": "",
-        "tda_region": "",
-        "overlap_ha": 0,
-        "confidence": "Not found",
-        "all_overlaps": pd.DataFrame()
-    }
-
-    if regions_gdf is None or regions_gdf.empty:
-        empty_result["confidence"] = "Region layer missing"
-        return empty_result
-
-    if project_gdf is None or project_gdf.empty:
-        empty_result["confidence"] = "Uploaded layer empty"
-        return empty_result
-
-    if project_gdf.crs is None:
-        empty_result["confidence"] = "Uploaded layer CRS missing"
-        return empty_result
-
-    project = _clean_geometries(project_gdf)
-    regions = _clean_geometries(regions_gdf)
-
-    if project.empty or regions.empty:
-        empty_result["confidence"] = "No valid geometry"
-        return empty_result
-
-    nr_field = _find_field(regions, ["NRNAME", "Natural_Region", "NAT_REGION", "REGION"])
-    nsr_field = _find_field(regions, ["NSRNAME", "Natural_Subregion", "SUBREGION", "NSR_NAME"])
-
-    if nr_field is None:
-        empty_result["confidence"] = "NRNAME field missing"
-        return empty_result
-
-    try:
-        if regions.crs is None:
-            empty_result["confidence"] = "Region layer CRS missing"
-            return empty_result
-
-        if regions.crs != project.crs:
-            regions = regions.to_crs(project.crs)
-
-        project_geom = _safe_union(project.geometry)
-
-        # First filter by intersects in native/project CRS.
-        candidates = regions[regions.geometry.intersects(project_geom)].copy()
-
-        if candidates.empty:
-            empty_result["confidence"] = "No overlap"
-            return empty_result
-
-        # Use a Canada equal-area CRS to calculate overlap area.
-        project_eq = project.to_crs(epsg=3347)
-        candidates_eq = candidates.to_crs(epsg=3347)
-        project_geom_eq = _safe_union(project_eq.geometry)
-
-        overlap_rows = []
-        for idx, row in candidates_eq.iterrows():
-            try:
-                overlap_area_ha = row.geometry.intersection(project_geom_eq).area / 10000
-            except Exception:
-                overlap_area_ha = 0
-
-            if overlap_area_ha > 0:
-                source_row = candidates.loc[idx]
-                region_raw = str(source_row.get(nr_field, "")).strip()
-                subregion_raw = str(source_row.get(nsr_field, "")).strip() if nsr_field else ""
-
-                overlap_rows.append({
-                    "NRNAME": region_raw,
-                    "NSRNAME": subregion_raw,
-                    "Overlap_Ha": round(overlap_area_ha, 4),
-                    "TDARegion": normalize_tda_region_name(region_raw)
-                })
-
-        if not overlap_rows:
-            empty_result["confidence"] = "No measurable overlap"
-            return empty_result
-
-        overlaps = pd.DataFrame(overlap_rows)
-        overlaps = (
-            overlaps
-            .groupby(["NRNAME", "NSRNAME", "TDARegion"], dropna=False, as_index=False)["Overlap_Ha"]
-            .sum()
-            .sort_values("Overlap_Ha", ascending=False)
-        )
-
-        top = overlaps.iloc[0]
-        confidence = "Single region" if len(overlaps) == 1 else "Multiple regions - largest overlap used"
-
-        return {
-            "region_raw": top["NRNAME"],
-            "subregion_raw": top["NSRNAME"],
-            "tda_region": top["TDARegion"],
-            "overlap_ha": float(top["Overlap_Ha"]),
-            "confidence": confidence,
-            "all_overlaps": overlaps
-        }
-
-    except Exception as e:
-        empty_result["confidence"] = f"Error: {e}"
-        return empty_result
-
-
-
-
-# --- ATS spatial lookup ---
-# GitHub/Streamlit repo setup expected:
-# ATS/
-#   ATS_QRT.zip
-# The ZIP can contain either:
-#   ATS_QRT.gpkg
-# or shapefile pieces such as .shp, .shx, .dbf, .prj, etc.
-ATS_LAYER_FOLDER = Path(__file__).resolve().parent / "ATS"
-ATS_LAYER_ZIP_NAME = "ATS_QRT.zip"
-
-
-def find_ats_zip_path():
-    """Find the ATS zip in the repo, with a flexible fallback."""
-    preferred = ATS_LAYER_FOLDER / ATS_LAYER_ZIP_NAME
-    if preferred.exists():
-        return preferred
-
-    if ATS_LAYER_FOLDER.exists():
-        zip_files = sorted(ATS_LAYER_FOLDER.glob("*.zip"))
-        if zip_files:
-            return zip_files[0]
-
-    return preferred
-
-
-def get_ats_folder_files():
-    """Small debug helper for Streamlit Cloud path/LFS issues."""
-    if not ATS_LAYER_FOLDER.exists():
-        return []
-    return sorted([p.name for p in ATS_LAYER_FOLDER.iterdir()])
-
-
-def _value_is_blank(value):
-    """Treat NaN/None/empty strings as blank."""
-    try:
-        if pd.isna(value):
-            return True
-    except Exception:
-        pass
-    return str(value).strip() == ""
-
-
-def _number_text(value, width):
-    """Return the first number in a value, zero-padded to the requested width."""
-    if _value_is_blank(value):
-        return ""
-    match = re.search(r"\d+", str(value))
-    if not match:
-        return str(value).strip()
-    return match.group(0).zfill(width)
-
-
-def _meridian_text(value):
-    """Return meridian as W5, W6, etc."""
-    if _value_is_blank(value):
-        return ""
-    text = str(value).strip().upper().replace(" ", "")
-    if text.startswith("W"):
-        return text
-    match = re.search(r"\d+", text)
-    if match:
-        return f"W{match.group(0)}"
-    return text
-
-
-def _quarter_text(value):
-    """Return quarter section text like NE/SW, or blank if missing."""
-    if _value_is_blank(value):
-        return ""
-    text = str(value).strip().upper().replace(" ", "")
-    if text in {"NAN", "NONE", "NULL", "0", "-"}:
-        return ""
-    return text
-
-
 @st.cache_resource(show_spinner=False)
 def load_ats_layer():
-    """
-    Loads the Alberta ATS layer from ATS/ATS_QRT.zip in the repo.
-    Supports either a GeoPackage (.gpkg) or shapefile (.shp) inside the ZIP.
+    """Extracts and prepares the ATS layer once per process (see footprints.open_ats_layer)."""
+    return open_ats_layer()
 
-    Returns:
-        ats_gdf, path_used, error_message
-    """
-    ats_zip_path = find_ats_zip_path()
-
-    if not ats_zip_path.exists():
-        return (
-            None,
-            str(ats_zip_path),
-            f"ATS zip not found. Looking in {ATS_LAYER_FOLDER}. Files seen: {get_ats_folder_files()}"
-        )
-
-    try:
-        file_size = ats_zip_path.stat().st_size
-
-        # If Streamlit/GitHub did not pull the real Git LFS object, it may only see a tiny text pointer file.
-        try:
-            first_bytes = ats_zip_path.read_bytes()[:200]
-            if b"git-lfs.github.com/spec" in first_bytes:
-                return (
-                    None,
-                    str(ats_zip_path),
-                    f"Git LFS pointer file detected instead of real zip. File size seen by Streamlit: {file_size} bytes. "
-                    "Reboot/redeploy Streamlit after confirming Git LFS is enabled and the file uploaded."
-                )
-        except Exception:
-            pass
-
-        if not zipfile.is_zipfile(ats_zip_path):
-            return (
-                None,
-                str(ats_zip_path),
-                f"File exists but is not a readable zip. File size: {file_size} bytes. Files in ATS folder: {get_ats_folder_files()}"
-            )
-
-        extract_dir = Path(tempfile.mkdtemp(prefix="ats_layer_"))
-        with zipfile.ZipFile(ats_zip_path, "r") as z:
-            z.extractall(extract_dir)
-
-        # Your ATS_QRT.zip currently contains ATS_QRT.gpkg, so read .gpkg first.
-        gpkg_files = sorted(extract_dir.rglob("*.gpkg"))
-        shp_files = sorted(extract_dir.rglob("*.shp"))
-
-        if gpkg_files:
-            ats_path = gpkg_files[0]
-        elif shp_files:
-            ats_path = shp_files[0]
-        else:
-            found_files = sorted([str(p.relative_to(extract_dir)) for p in extract_dir.rglob("*") if p.is_file()])[:20]
-            return (
-                None,
-                str(ats_zip_path),
-                f"No .gpkg or .shp found inside {ats_zip_path.name}. Files seen: {found_files}"
-            )
-
-        ats_gdf = gpd.read_file(ats_path)
-        return ats_gdf, str(ats_path), ""
 
-    except Exception as e:
-        return None, str(ats_zip_path), f"{type(e).__name__}: {e}"
-
-
-def format_ats_from_row(row, fields):
-    """Build ATS label like SW-12-076-06-W5 from ATS layer fields."""
-    qs_field = fields.get("qs")
-    sec_field = fields.get("sec")
-    twp_field = fields.get("twp")
-    rge_field = fields.get("rge")
-    m_field = fields.get("m")
-    label_field = fields.get("label")
-
-    sec = _number_text(row.get(sec_field, ""), 2) if sec_field else ""
-    twp = _number_text(row.get(twp_field, ""), 3) if twp_field else ""
-    rge = _number_text(row.get(rge_field, ""), 2) if rge_field else ""
-    mer = _meridian_text(row.get(m_field, "")) if m_field else ""
-    qs = _quarter_text(row.get(qs_field, "")) if qs_field else ""
-
-    if sec and twp and rge and mer:
-        prefix = f"{qs}-" if qs else ""
-        return f"{prefix}{sec}-{twp}-{rge}-{mer}"
-
-    if label_field and not _value_is_blank(row.get(label_field, "")):
-        return str(row.get(label_field)).strip()
-
-    return ""
-
-
-def get_ats_intersections(project_gdf, ats_gdf):
+@st.cache_resource(show_spinner=False)
+def get_layer_warmup():
     """
-    Returns all ATS quarter/section labels intersected by the uploaded project shapefile.
+    Loads both reference layers on a background thread, once per process.
+    The first script run after the server starts kicks it off, and sessions
+    show its progress instead of waiting for the layers.
     """
-    empty_result = {
-        "ats_list": [],
-        "ats_text": "",
-        "count": 0,
-        "confidence": "Not found"
-    }
-
-    if ats_gdf is None or ats_gdf.empty:
-        empty_result["confidence"] = "ATS layer missing"
-        return empty_result
-
-    if project_gdf is None or project_gdf.empty:
-        empty_result["confidence"] = "Uploaded layer empty"
-        return empty_result
+    return LayerWarmup(natural_regions=load_natural_regions_layer, ats=load_ats_layer).start()
 
-    if project_gdf.crs is None:
-        empty_result["confidence"] = "Uploaded layer CRS missing"
-        return empty_result
 
-    if ats_gdf.crs is None:
-        empty_result["confidence"] = "ATS layer CRS missing"
-        return empty_result
+@st.cache_resource(show_spinner=False)
+def get_footprint_cache():
+    """Processed footprint results, shared by every session on the server."""
+    return FootprintCache(max_entries=64)
 
-    try:
-        project = _clean_geometries(project_gdf)
-        if project.empty:
-            empty_result["confidence"] = "No valid project geometry"
-            return empty_result
 
-        # Reproject the uploaded footprint into the ATS CRS instead of reprojecting all ATS polygons.
-        if project.crs != ats_gdf.crs:
-            project = project.to_crs(ats_gdf.crs)
+@st.cache_resource(show_spinner=False, max_entries=1, on_release=FootprintPool.shutdown)
+def get_footprint_pool(regions_path, ats_path, layers_key):
+    """Dissolver worker processes for the current reference layers; replaced when a layer file changes."""
+    return FootprintPool(regions_path, ats_path)
 
-        project_geom = _safe_union(project.geometry)
 
-        # Spatial index first, fallback to direct intersects if needed.
-        try:
-            idx = ats_gdf.sindex.query(project_geom, predicate="intersects")
-            candidates = ats_gdf.iloc[idx].copy()
-        except Exception:
-            candidates = ats_gdf[ats_gdf.geometry.intersects(project_geom)].copy()
-
-        if candidates.empty:
-            empty_result["confidence"] = "No ATS overlap"
-            return empty_result
-
-        fields = {
-            "qs": _find_field(candidates, ["QS", "QTR", "QUARTER", "QUARTERSEC"]),
-            "sec": _find_field(candidates, ["SEC", "SECTION"]),
-            "twp": _find_field(candidates, ["TWP", "TOWNSHIP"]),
-            "rge": _find_field(candidates, ["RGE", "RANGE"]),
-            "m": _find_field(candidates, ["M", "MER", "MERIDIAN"]),
-            "label": _find_field(candidates, ["Label", "LABEL", "ATS", "ATS_LABEL"]),
-        }
-
-        ats_values = []
-        for _, row in candidates.iterrows():
-            try:
-                # Confirm actual intersection, not just bounding-box candidate.
-                if not row.geometry.intersects(project_geom):
-                    continue
-                ats_label = format_ats_from_row(row, fields)
-                if ats_label:
-                    ats_values.append(ats_label)
-            except Exception:
-                continue
+# Start the warm-up before anything is drawn; it does not block this run.
+get_layer_warmup()
 
-        ats_values = sorted(set(ats_values))
 
-        if not ats_values:
-            empty_result["confidence"] = "ATS fields missing or unreadable"
-            return empty_result
+# --- Report template ---
+@st.cache_resource(show_spinner=False)
+def load_report_template():
+    return ReportTemplate(REPORT_TEMPLATE_PATH)
 
-        ats_text = ", ".join(ats_values)
-        return {
-            "ats_list": ats_values,
-            "ats_text": ats_text,
-            "count": len(ats_values),
-            "confidence": "ATS found"
-        }
 
-    except Exception as e:
-        empty_result["confidence"] = f"Error: {e}"
-        return empty_result
+@st.cache_data(show_spinner=False, max_entries=32)
+def render_report(fields, rows):
+    """Filled report bytes; generating again with unchanged inputs returns the memoized copy."""
+    return load_report_template().render(fields, rows)
 
 
 # --- Default values ---
@@ -556,7 +159,7 @@ default_values = {
 
 # --- Session state initialization ---
 if "results_log" not in st.session_state:
-    st.session_state.results_log = []
+    st.session_state.results_log = StandLog()
 
 if "current_entry_index" not in st.session_state:
     st.session_state.current_entry_index = -1  # -1 means new entry
@@ -609,11 +212,14 @@ if "legal_loc" not in st.session_state:
 if "ctlr_list" not in st.session_state:
     st.session_state.ctlr_list = [{"type": "", "number_holder": ""}]
 
+if "stand_area_queue" not in st.session_state:
+    st.session_state.stand_area_queue = []
+
 
 # --- Reset widget defaults if triggered ---
 if st.session_state.reset_trigger:
     # Clear session state for non-widget keys
-    st.session_state.results_log = []
+    st.session_state.results_log = StandLog()
     st.session_state.current_entry_index = -1
     st.session_state.edit_mode = False
     st.session_state.show_salvage_form = False
@@ -632,10 +238,17 @@ if st.session_state.reset_trigger:
     st.session_state.region = default_values["region"]
     st.session_state.legal_loc = default_values["legal_loc"]
     st.session_state.ctlr_list = [{"type": "", "number_holder": ""}]
+    st.session_state.stand_area_queue = []
+    st.session_state.stand_layer_message = ""
     st.session_state.reset_trigger = False
     st.rerun()
 
 
+# --- Scratch space ---
+# Remove scratch space left by sessions that ended without cleaning up (throttled per process).
+sweep_expired()
+
+
 # --- Apply pending autofill from uploaded shapefile before widgets are created ---
 # Processing happens later in the script, after the widgets have already been drawn.
 # To safely update widget values, processing stores pending values and reruns once.
@@ -678,121 +291,78 @@ st.header(
 
 
 # --- Calculate AVI and volumes ---
-def calculate_avi_and_volumes(
-    is_merch,
-    crown_density,
-    avg_stand_height,
-    dom_species,
-    dom_cover,
-    sec_species,
-    sec_cover,
-    area,
-    region
-):
-    global avi_code, c_vol, d_vol, c_load, d_load, c_vol_ha, d_vol_ha, group, total_val
-
-    # Build AVI code
-    avi_code = ""
-    if is_merch.lower() == "yes":
-        avi_code += "m"
-
-    if 6 <= crown_density <= 30:
-        avi_code += "A"
-    elif 31 <= crown_density <= 50:
-        avi_code += "B"
-    elif 51 <= crown_density <= 70:
-        avi_code += "C"
-    elif 71 <= crown_density <= 100:
-        avi_code += "D"
-
-    avi_code += str(avg_stand_height)
-    avi_code += dom_species + str(dom_cover // 10)
-
-    if dom_cover < 100 and sec_species:
-        avi_code += sec_species + str(sec_cover // 10)
-
-    # Helper functions
-    def density_class(d):
-        return "AB" if 6 <= d <= 50 else "CD"
-
-    def height_bin(h):
-        if h <= 4:
-            return "0-4"
-        if h <= 8:
-            return "5-8"
-        if h <= 10:
-            return "9-10"
-        if h <= 25:
-            return str(h)  # Single values for 9-25
-        if h <= 28:
-            return "26-28"
-        return "29+"
-
-    def get_structure_group(dom_sp, dom_pct, sec_sp, sec_pct):
-        t_dec = (dom_pct if dom_sp in deciduous else 0) + (sec_pct if sec_sp in deciduous else 0)
-        t_con = (dom_pct if dom_sp in conifers else 0) + (sec_pct if sec_sp in conifers else 0)
-
-        if t_dec >= 70:
-            return "D"
-
-        if t_con >= 70:
-            if dom_sp == "Sw":
-                return "C-Sw"
-            if dom_sp == "P":
-                return "C-P"
-            if dom_sp == "Sb":
-                return "C-Sb"
-            # Fb, Fd, Lt, and other conifers do not have a C-Sx column in the TDA table.
-            # Use the available C-Sw conifer-dominant table instead of returning zero.
-            return "C-Sw"
-
-        if t_con > 30 and t_dec < 70:
-            if dom_sp == "P":
-                return "MX-P"
-            return "MX-Sx"
-
-        return None
-
+def calculate_current_stand(*stand_inputs):
+    """calculate_avi_and_volumes for the form, reporting TDA problems on the page instead of raising."""
     try:
-        df = load_tda(region)
-        key = f"{height_bin(avg_stand_height)} ({density_class(crown_density)})"
-        row = df[df["Height_and_Density"].str.strip() == key]
-
-        group = get_structure_group(dom_species, dom_cover, sec_species, sec_cover)
-        valid_groups = {"D", "MX-P", "MX-Sx", "C-Sw", "C-P", "C-Sb"}
-        total_col = f"Total ({group})" if group in valid_groups else "Total (D)"
-        total_val = row[total_col].values[0] if not row.empty and total_col in df.columns else 0
-
-        if dom_cover == 100:
-            c_vol_ha = total_val if dom_species in conifers else None
-            d_vol_ha = total_val if dom_species in deciduous else 0
-        else:
-            c_pct = (dom_cover if dom_species in conifers else 0) + (sec_cover if sec_species in conifers else 0)
-            d_pct = (dom_cover if dom_species in deciduous else 0) + (sec_cover if sec_species in deciduous else 0)
+        return calculate_avi_and_volumes(*stand_inputs)
+    except Exception as e:
+        st.error(f"Error reading TDA table: {e}")
+        return StandResult()
 
-            c_vol_ha = round((c_pct / 100) * total_val, 1) if c_pct > 0 else None
-            d_vol_ha = round((d_pct / 100) * total_val, 1) if d_pct > 0 else 0
 
-        c_vol = round(c_vol_ha * area, 5) if c_vol_ha is not None else 0
-        d_vol = round(d_vol_ha * area, 5) if d_vol_ha is not None else 0
-        c_load = round(c_vol / 40, 5) if c_vol is not None else 0
-        d_load = round(d_vol / 40, 5) if d_vol is not None else 0
+# --- Import stand polygons ---
+def read_uploaded_layer(uploaded_file):
+    """Read a zipped shapefile or a GeoPackage straight from the uploaded bytes."""
+    import geopandas as gpd
+    return gpd.read_file(io.BytesIO(uploaded_file.getvalue()))
 
-    except Exception as e:
-        st.error(f"Error reading TDA table: {e}")
-        c_vol = d_vol = c_load = d_load = 0
-        c_vol_ha = d_vol_ha = None
-        avi_code = ""
-        group = None
-        total_val = 0
 
+with st.expander("Import stand polygons (optional)"):
+    stand_layer_file = st.file_uploader(
+        "Stand-divided polygon layer (.zip shapefile or .gpkg)",
+        type=["zip", "gpkg"],
+        key="stand_layer_file",
+        help=(
+            "Upload the footprint already divided into tree stands. The area (ha) of every polygon is calculated "
+            "in one pass (EPSG:3347), so it does not need to be typed in. If the layer also has species, cover, "
+            "height and crown density fields, every stand is added to the saved entries. Otherwise the areas "
+            "are filled into the Area box one stand at a time as you save entries."
+        )
+    )
 
-# Initialize global variables with defaults
-avi_code = ""
-c_vol = d_vol = c_load = d_load = 0
-c_vol_ha = d_vol_ha = None
-group = None
-total_val = 0
+    # Only process a newly uploaded file; reruns reuse the stored areas/entries.
+    if stand_layer_file is not None and st.session_state.get("stand_layer_file_id") != stand_layer_file.file_id:
+        st.session_state.stand_layer_file_id = stand_layer_file.file_id
+        try:
+            stands_gdf = read_uploaded_layer(stand_layer_file)
+            stand_areas = polygon_area_ha(stands_gdf)
+        except Exception as e:
+            st.session_state.stand_layer_message = f"Could not read stand layer: {type(e).__name__}: {e}"
+            stand_areas = None
+
+        if stand_areas is not None and stand_areas.empty:
+            st.session_state.stand_layer_message = "The uploaded stand layer has no polygons."
+        elif stand_areas is not None and not has_stand_attributes(stands_gdf.columns):
+            # No stand attributes: queue the areas and fill the form with the first one.
+            st.session_state.stand_area_queue = stand_areas.tolist()
+            st.session_state.pending_auto_area = st.session_state.stand_area_queue[0]
+            st.session_state.stand_layer_message = (
+                f"{len(stand_areas)} stand areas loaded ({stand_areas.sum():.4f} ha total)."
+            )
+        elif stand_areas is not None:
+            try:
+                stand_inputs = build_stand_inputs(
+                    stands_gdf.assign(area=stand_areas),
+                    default_region=st.session_state.region
+                )
+                stand_results = calculate_avi_and_volumes_batch(stand_inputs)
+                st.session_state.results_log.extend_frame(stand_results)
+                st.session_state.stand_layer_message = (
+                    f"Added {len(stand_results)} stands ({stand_areas.sum():.4f} ha) to the saved entries."
+                )
+            except ValueError as e:
+                st.session_state.stand_layer_message = f"Could not add stands: {e}"
+
+        st.rerun()
+
+    if st.session_state.get("stand_layer_message"):
+        st.info(st.session_state.stand_layer_message)
+
+    if st.session_state.stand_area_queue:
+        st.caption(
+            f"{len(st.session_state.stand_area_queue)} uploaded stand(s) left. "
+            f"Area is filled with the next stand ({st.session_state.stand_area_queue[0]:.4f} ha)."
+        )
 
 
 # --- Navigation bar ---
@@ -805,7 +375,11 @@ st.subheader(
 col_nav1, col_nav2, col_nav3 = st.columns([1, 1, 3])
 
 with col_nav1:
-    st.write("")
+    if st.button("Undo Last Entry", disabled=not st.session_state.results_log):
+        del st.session_state.results_log[-1]
+        st.session_state.current_entry_index = -1
+        st.session_state.edit_mode = False
+        st.rerun()
 
 with col_nav2:
     if st.button("Save Entry"):
@@ -820,7 +394,7 @@ with col_nav2:
         )
 
         # Calculate volumes and loads for the current entry
-        calculate_avi_and_volumes(
+        stand = calculate_current_stand(
             st.session_state.is_merch,
             st.session_state.crown_density,
             st.session_state.avg_stand_height,
@@ -839,10 +413,10 @@ with col_nav2:
         ):
             # Save current entry if in edit mode
             entry_data = {
-                "C_Vol": c_vol,
-                "C_Load": c_load,
-                "D_Vol": d_vol,
-                "D_Load": d_load,
+                "C_Vol": stand.c_vol,
+                "C_Load": stand.c_load,
+                "D_Vol": stand.d_vol,
+                "D_Load": stand.d_load,
                 "dom_sp": dom_species,
                 "dom_pct": st.session_state.dom_cover,
                 "sec_sp": sec_species,
@@ -859,10 +433,10 @@ with col_nav2:
         elif st.session_state.current_entry_index == -1:
             # Save new entry
             entry_data = {
-                "C_Vol": c_vol,
-                "C_Load": c_load,
-                "D_Vol": d_vol,
-                "D_Load": d_load,
+                "C_Vol": stand.c_vol,
+                "C_Load": stand.c_load,
+                "D_Vol": stand.d_vol,
+                "D_Load": stand.d_load,
                 "dom_sp": dom_species,
                 "dom_pct": st.session_state.dom_cover,
                 "sec_sp": sec_species,
@@ -876,6 +450,12 @@ with col_nav2:
             st.session_state.results_log.append(entry_data)
             st.success("New entry saved!")
 
+            # Move on to the next uploaded stand polygon, if any.
+            if st.session_state.stand_area_queue:
+                st.session_state.stand_area_queue.pop(0)
+                if st.session_state.stand_area_queue:
+                    st.session_state.pending_auto_area = st.session_state.stand_area_queue[0]
+
         # Transition to new entry without resetting input fields
         st.session_state.current_entry_index = -1
         st.session_state.edit_mode = False
@@ -885,10 +465,6 @@ with col_nav3:
     st.write(f"Entries Saved: {len(st.session_state.results_log)}")
 
 
-# --- Inputs & AVI calculation ---
-col1, col2 = st.columns(2)
-
-
 # --- NEW: synced sliders so Dom + Sec = 100 ---
 def _sync_from_dom():
     st.session_state.sec_cover = 100 - int(st.session_state.dom_cover)
@@ -898,248 +474,238 @@ def _sync_from_sec():
     st.session_state.dom_cover = 100 - int(st.session_state.sec_cover)
 
 
-with col1:
-    # Load saved entry data if in edit mode and index is valid
-    if (
-        st.session_state.edit_mode
-        and st.session_state.current_entry_index >= 0
-        and st.session_state.results_log
-        and st.session_state.current_entry_index < len(st.session_state.results_log)
-    ):
-        entry = st.session_state.results_log[st.session_state.current_entry_index]
-        st.session_state.is_merch = "Yes" if entry.get("is_merch", True) else "No"
-        st.session_state.crown_density = entry.get("crown_density", default_values["crown_density"])
-        st.session_state.avg_stand_height = entry.get("avg_stand_height", default_values["avg_stand_height"])
-        st.session_state.dom_sel = f"{entry['dom_sp']} ({species_names[entry['dom_sp']]})"
-        st.session_state.dom_cover = entry["dom_pct"]
-        st.session_state.sec_cover = entry["sec_pct"]
-        st.session_state.sec_sel = (
-            f"{entry['sec_sp']} ({species_names[entry['sec_sp']]})" if entry["sec_sp"] else ""
+# --- Inputs & AVI calculation ---
+@st.fragment
+def stand_panel():
+    """
+    Stand inputs, output cards and the P3 converter. Runs as a fragment, so
+    moving a slider reruns only this panel, not the sidebar tools or report form.
+    """
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Load saved entry data if in edit mode and index is valid
+        if (
+            st.session_state.edit_mode
+            and st.session_state.current_entry_index >= 0
+            and st.session_state.results_log
+            and st.session_state.current_entry_index < len(st.session_state.results_log)
+        ):
+            entry = st.session_state.results_log[st.session_state.current_entry_index]
+            st.session_state.is_merch = "Yes" if entry.get("is_merch", True) else "No"
+            st.session_state.crown_density = entry.get("crown_density", default_values["crown_density"])
+            st.session_state.avg_stand_height = entry.get("avg_stand_height", default_values["avg_stand_height"])
+            st.session_state.dom_sel = f"{entry['dom_sp']} ({species_names[entry['dom_sp']]})"
+            st.session_state.dom_cover = entry["dom_pct"]
+            st.session_state.sec_cover = entry["sec_pct"]
+            st.session_state.sec_sel = (
+                f"{entry['sec_sp']} ({species_names[entry['sec_sp']]})" if entry["sec_sp"] else ""
+            )
+            st.session_state.area = entry.get("area", default_values["area"])
+            st.session_state.region = entry.get("region", default_values["region"])
+
+        # --- CHANGE: Removed "Is it merch?" input; always assume Yes ---
+        is_merch = "Yes"
+        st.session_state.is_merch = "Yes"
+
+        crown_density = st.slider(
+            "Crown Density (%)",
+            6,
+            100,
+            st.session_state.get("crown_density", default_values["crown_density"]),
+            key="crown_density",
+            help="Utilize recent satellite imagery to estimate crown density within the tree stand."
         )
-        st.session_state.area = entry.get("area", default_values["area"])
-        st.session_state.region = entry.get("region", default_values["region"])
-
-    # --- CHANGE: Removed "Is it merch?" input; always assume Yes ---
-    is_merch = "Yes"
-    st.session_state.is_merch = "Yes"
-
-    crown_density = st.slider(
-        "Crown Density (%)",
-        6,
-        100,
-        st.session_state.get("crown_density", default_values["crown_density"]),
-        key="crown_density",
-        help="Utilize recent satellite imagery to estimate crown density within the tree stand."
-    )
 
-    avg_stand_height = st.slider(
-        "Average Stand Tree Height",
-        0,
-        40,
-        st.session_state.get("avg_stand_height", default_values["avg_stand_height"]),
-        step=1,
-        key="avg_stand_height",
-        help=(
-            "Use georeferenced P3 maps and satellite imagery to estimate tree height. "
-            "The second value in old P3 AVI codes (e.g., C1SbLt) gives approximate height in meters (1=10m). "
-            "Though outdated, this offers a general idea of past stand height—check map dates or cut blocks to help estimate current height. "
-            "For older data, apply average growth rates: poplar 1–3 m/yr, aspen 0.5–1 m, birch 0.5–1.5 m, spruce 0.3–0.6 m, pine 0.5–1 m, fir 0.3–0.5 m, larch ~0.5 m, adjusting for local conditions. "
-            "Google Earth shadow length can also be used with sun angle for trigonometric height estimates."
+        avg_stand_height = st.slider(
+            "Average Stand Tree Height",
+            0,
+            40,
+            st.session_state.get("avg_stand_height", default_values["avg_stand_height"]),
+            step=1,
+            key="avg_stand_height",
+            help=(
+                "Use georeferenced P3 maps and satellite imagery to estimate tree height. "
+                "The second value in old P3 AVI codes (e.g., C1SbLt) gives approximate height in meters (1=10m). "
+                "Though outdated, this offers a general idea of past stand height—check map dates or cut blocks to help estimate current height. "
+                "For older data, apply average growth rates: poplar 1–3 m/yr, aspen 0.5–1 m, birch 0.5–1.5 m, spruce 0.3–0.6 m, pine 0.5–1 m, fir 0.3–0.5 m, larch ~0.5 m, adjusting for local conditions. "
+                "Google Earth shadow length can also be used with sun angle for trigonometric height estimates."
+            )
         )
-    )
 
-    dom_sel = st.selectbox(
-        "Dominant Species",
-        species_choices,
-        key="dom_sel",
-        help="Enter the dominant species by percent cover within the stand"
-    )
-    dom_species = dom_sel.split(" ")[0]
-    st.session_state.dom_species = dom_species
-
-    # Dominant Cover % slider (synced)
-    dom_cover = st.slider(
-        "Dominant Cover %",
-        0,
-        100,
-        int(st.session_state.dom_cover),
-        step=10,
-        key="dom_cover",
-        on_change=_sync_from_dom
-    )
+        dom_sel = st.selectbox(
+            "Dominant Species",
+            species_choices,
+            key="dom_sel",
+            help="Enter the dominant species by percent cover within the stand"
+        )
+        dom_species = dom_sel.split(" ")[0]
+        st.session_state.dom_species = dom_species
+
+        # Dominant Cover % slider (synced)
+        dom_cover = st.slider(
+            "Dominant Cover %",
+            0,
+            100,
+            int(st.session_state.dom_cover),
+            step=10,
+            key="dom_cover",
+            on_change=_sync_from_dom
+        )
 
-    sec_opts = [""] + [c for c in species_choices if c.split(" ")[0] != dom_species]
-    sec_sel = st.selectbox(
-        "2nd Species",
-        sec_opts,
-        key="sec_sel",
-        help="Enter the second most dominant species by percent cover within the stand."
-    )
-    sec_species = sec_sel.split(" ")[0] if sec_sel else ""
-    st.session_state.sec_species = sec_species
-
-    # 2nd Cover % slider (synced)
-    sec_cover = st.slider(
-        "2nd Cover %",
-        0,
-        100,
-        int(st.session_state.sec_cover),
-        step=10,
-        key="sec_cover",
-        on_change=_sync_from_sec
-    )
+        sec_opts = [""] + [c for c in species_choices if c.split(" ")[0] != dom_species]
+        sec_sel = st.selectbox(
+            "2nd Species",
+            sec_opts,
+            key="sec_sel",
+            help="Enter the second most dominant species by percent cover within the stand."
+        )
+        sec_species = sec_sel.split(" ")[0] if sec_sel else ""
+        st.session_state.sec_species = sec_species
+
+        # 2nd Cover % slider (synced)
+        sec_cover = st.slider(
+            "2nd Cover %",
+            0,
+            100,
+            int(st.session_state.sec_cover),
+            step=10,
+            key="sec_cover",
+            on_change=_sync_from_sec
+        )
 
-    area = st.number_input(
-        "Area (ha)",
-        min_value=0.0,
-        value=st.session_state.get("area", default_values["area"]),
-        step=0.0001,
-        format="%.4f",
-        key="area",
-        help="Enter the tree stand area (ha) as calculated in QGIS. Formula for QGIS: $area / 10000"
-    )
+        area = st.number_input(
+            "Area (ha)",
+            min_value=0.0,
+            value=st.session_state.get("area", default_values["area"]),
+            step=0.0001,
+            format="%.4f",
+            key="area",
+            help="Enter the tree stand area (ha) as calculated in QGIS. Formula for QGIS: $area / 10000"
+        )
+
+        region = st.selectbox(
+            "Natural Region",
+            ["Boreal", "Foothills"],
+            key="region",
+            help="Input the natural region using the QGIS layer."
+        )
 
-    region = st.selectbox(
-        "Natural Region",
-        ["Boreal", "Foothills"],
-        key="region",
-        help="Input the natural region using the QGIS layer."
+
+    # Calculate AVI and volumes after inputs are defined
+    stand = calculate_current_stand(
+        is_merch,
+        crown_density,
+        avg_stand_height,
+        dom_species,
+        dom_cover,
+        sec_species,
+        sec_cover,
+        area,
+        region
     )
 
 
-# Calculate AVI and volumes after inputs are defined
-calculate_avi_and_volumes(
-    is_merch,
-    crown_density,
-    avg_stand_height,
-    dom_species,
-    dom_cover,
-    sec_species,
-    sec_cover,
-    area,
-    region
-)
+    # --- Styled outputs on the right (original colours) ---
+    with col2:
+        st.markdown(
+            f"""
+            <div style='padding:1em; border:2px solid #4CAF50; border-radius:12px;
+                        background-color:#f9f9f9; color:#000;'>
+                <h4 style='color:#4CAF50;'>Generated AVI Code</h4>
+                <p style='font-size:24px; font-weight:bold;'>{stand.avi_code}</p>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
+        # Volume per Hectare (blue) with TDA values and Group
+        con_vol_ha_str = "{:.5f}".format(stand.c_vol_ha) if stand.c_vol_ha is not None else "N/A"
+        dec_vol_ha_str = "{:.5f}".format(stand.d_vol_ha) if stand.d_vol_ha > 0 else "0"
+        st.markdown(
+            f"""
+            <div style='padding:1em; border:2px solid #2196F3; border-radius:12px;
+                        background-color:#f0f8ff; color:#000;'>
+                <h4 style='color:#2196F3;'>Volume per Hectare</h4>
+                <p><b>Con:</b> {con_vol_ha_str} m³/ha [TDA={stand.total_val if stand.c_vol_ha is not None else 'N/A'}, Group={stand.group if stand.c_vol_ha is not None else 'N/A'}]</p>
+                <p><b>Dec:</b> {dec_vol_ha_str} m³/ha [TDA={stand.total_val if stand.d_vol_ha > 0 else 'N/A'}, Group={stand.group if stand.d_vol_ha > 0 else 'N/A'}]</p>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
-# --- Styled outputs on the right (original colours) ---
-with col2:
-    st.markdown(
-        f"""
-        <div style='padding:1em; border:2px solid #4CAF50; border-radius:12px;
-                    background-color:#f9f9f9; color:#000;'>
-            <h4 style='color:#4CAF50;'>Generated AVI Code</h4>
-            <p style='font-size:24px; font-weight:bold;'>{avi_code}</p>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+        # Total Volume (orange)
+        st.markdown(
+            f"""
+            <div style='padding:1em; border:2px solid #FF9800; border-radius:12px;
+                        background-color:#fff8e1; color:#000;'>
+                <h4 style='color:#FF9800;'>Total Volume ({area} ha)</h4>
+                <p><b>Con:</b> {stand.c_vol:.5f} m³</p>
+                <p><b>Dec:</b> {stand.d_vol:.5f} m³</p>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
-    # Volume per Hectare (blue) with TDA values and Group
-    con_vol_ha_str = "{:.5f}".format(c_vol_ha) if c_vol_ha is not None else "N/A"
-    dec_vol_ha_str = "{:.5f}".format(d_vol_ha) if d_vol_ha > 0 else "0"
-    st.markdown(
-        f"""
-        <div style='padding:1em; border:2px solid #2196F3; border-radius:12px;
-                    background-color:#f0f8ff; color:#000;'>
-            <h4 style='color:#2196F3;'>Volume per Hectare</h4>
-            <p><b>Con:</b> {con_vol_ha_str} m³/ha [TDA={total_val if c_vol_ha is not None else 'N/A'}, Group={group if c_vol_ha is not None else 'N/A'}]</p>
-            <p><b>Dec:</b> {dec_vol_ha_str} m³/ha [TDA={total_val if d_vol_ha > 0 else 'N/A'}, Group={group if d_vol_ha > 0 else 'N/A'}]</p>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+        # Load (purple)
+        st.markdown(
+            f"""
+            <div style='padding:1em; border:2px solid #9C27B0; border-radius:12px;
+                        background-color:#f3e5f5; color:#000;'>
+                <h4 style='color:#9C27B0;'>Load</h4>
+                <p><b>Con:</b> {stand.c_load:.5f}</p>
+                <p><b>Dec:</b> {stand.d_load:.5f}</p>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
-    # Total Volume (orange)
-    st.markdown(
-        f"""
-        <div style='padding:1em; border:2px solid #FF9800; border-radius:12px;
-                    background-color:#fff8e1; color:#000;'>
-            <h4 style='color:#FF9800;'>Total Volume ({area} ha)</h4>
-            <p><b>Con:</b> {c_vol:.5f} m³</p>
-            <p><b>Dec:</b> {d_vol:.5f} m³</p>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+        # --- P3 Map Search Converter ---
+        def convert_lsd_to_p3(lsd):
+            # Accepts LSD format such as NE-20-48-11-W5 or se-29-48-11-w5
+            code = parse_ats_text(lsd)
+            if code is not None:
+                return f"P3:{ats_code_to_p3(code)}*"
+            return None
+
+        st.subheader(
+            "P3 Map Search Converter",
+            help="Enter one or more ATS locations (e.g., NE-20-48-11-W5) in the text area below, one per line. The output will show the SharePoint P3 map search format (P3:MRRTTT*)."
+        )
 
-    # Load (purple)
-    st.markdown(
-        f"""
-        <div style='padding:1em; border:2px solid #9C27B0; border-radius:12px;
-                    background-color:#f3e5f5; color:#000;'>
-            <h4 style='color:#9C27B0;'>Load</h4>
-            <p><b>Con:</b> {c_load:.5f}</p>
-            <p><b>Dec:</b> {d_load:.5f}</p>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+        lsd_input = st.text_input(
+            "",
+            placeholder="NE-20-48-11-W5 SE-35-67-7-W6",
+            key="lsd_input",
+            label_visibility="collapsed"
+        )
 
-    # --- P3 Map Search Converter ---
-    def convert_lsd_to_p3(lsd):
-        # Regular expression to match LSD format: e.g., NE-20-48-11-W5 or se-29-48-11-w5
-        pattern = r"^(?:[A-Za-z]{2}-)?\d{1,2}-\d{1,3}-\d{1,2}-[Ww](\d)$"
-        match = re.match(pattern, lsd.strip(), re.IGNORECASE)
-        if match:
-            meridian = match.group(1)
-            parts = lsd.strip().replace(" ", "-").split("-")
-            range_num = parts[-2]
-            township = parts[-3]
-            range_padded = range_num.zfill(2)
-            township_padded = township.zfill(3)
-            return f"P3:{meridian}{range_padded}{township_padded}*"
-        return None
-
-    st.subheader(
-        "P3 Map Search Converter",
-        help="Enter one or more ATS locations (e.g., NE-20-48-11-W5) in the text area below, one per line. The output will show the SharePoint P3 map search format (P3:MRRTTT*)."
-    )
+        if lsd_input:
+            lsds = [lsd.strip() for lsd in lsd_input.replace("\n", " ").split()]
+            results = [convert_lsd_to_p3(lsd) for lsd in lsds if convert_lsd_to_p3(lsd)]
+            if results:
+                st.text("\n".join(results))
 
-    lsd_input = st.text_input(
-        "",
-        placeholder="NE-20-48-11-W5 SE-35-67-7-W6",
-        key="lsd_input",
-        label_visibility="collapsed"
-    )
 
-    if lsd_input:
-        lsds = [lsd.strip() for lsd in lsd_input.replace("\n", " ").split()]
-        results = [convert_lsd_to_p3(lsd) for lsd in lsds if convert_lsd_to_p3(lsd)]
-        if results:
-            st.text("\n".join(results))
+stand_panel()
 
 
 # --- Show totals ---
 if st.button("Finish (Show Totals)", key="finish_totals"):
-    total_c_vol = sum(e["C_Vol"] for e in st.session_state.results_log if e["C_Vol"] is not None)
-    total_c_load = sum(e["C_Load"] for e in st.session_state.results_log if e["C_Load"] is not None)
-    total_d_vol = sum(e["D_Vol"] for e in st.session_state.results_log if e["D_Vol"] is not None)
-    total_d_load = sum(e["D_Load"] for e in st.session_state.results_log if e["D_Load"] is not None)
-
-    raw_con = (
-        sum(e["dom_pct"] for e in st.session_state.results_log if e["dom_sp"] in conifers)
-        + sum(e["sec_pct"] for e in st.session_state.results_log if e["sec_sp"] in conifers)
-    )
-    raw_dec = (
-        sum(e["dom_pct"] for e in st.session_state.results_log if e["dom_sp"] in deciduous)
-        + sum(e["sec_pct"] for e in st.session_state.results_log if e["sec_sp"] in deciduous)
-    )
-
-    pct_con = round(raw_con / (raw_con + raw_dec) * 100, 0) if (raw_con + raw_dec) > 0 else 0
-    pct_dec = round(raw_dec / (raw_con + raw_dec) * 100, 0) if (raw_con + raw_dec) > 0 else 0
+    totals = st.session_state.results_log.totals()
 
     st.markdown(
         f"""
         <div style='padding:1em; border:2px solid #607D8B; border-radius:12px;
                     background-color:#ECEFF1; color:#000;'>
           <h4 style='color:#607D8B;'>Final Tally</h4>
-          <p><b>Total C_Vol:</b> {total_c_vol:.5f} m³</p>
-          <p><b>Total C_Load:</b> {total_c_load:.5f}</p>
-          <p><b>Total D_Vol:</b> {total_d_vol:.5f} m³</p>
-          <p><b>Total D_Load:</b> {total_d_load:.5f}</p>
+          <p><b>Total C_Vol:</b> {totals.c_vol:.5f} m³</p>
+          <p><b>Total C_Load:</b> {totals.c_load:.5f}</p>
+          <p><b>Total D_Vol:</b> {totals.d_vol:.5f} m³</p>
+          <p><b>Total D_Load:</b> {totals.d_load:.5f}</p>
           <hr>
-          <p><b>% Coniferous:</b> {pct_con}%</p>
-          <p><b>% Deciduous:</b> {pct_dec}%</p>
+          <p><b>% Coniferous:</b> {totals.pct_con}%</p>
+          <p><b>% Deciduous:</b> {totals.pct_dec}%</p>
         </div>
         """,
         unsafe_allow_html=True
@@ -1167,23 +733,10 @@ if st.session_state.show_salvage_form:
         help="Start and end points of footprint or a single legal if it calls within one Quarter Section."
     )
 
-    veg_types = [
-        "Native grassland",
-        "Tame pasture",
-        "Cropland",
-        "Sparsely or non-vegetated",
-        "Cutblock - planted",
-        "Natural regeneration >2m",
-        "Treed wetland",
-        "Shrubby wetland",
-        "Grass or grass-like wetland",
-        "Native aspen parkland",
-        "Other (specify)"
-    ]
 
     vegetation = st.multiselect(
         "Vegetation (check all that apply):",
-        veg_types,
+        VEGETATION_TYPES,
         key="vegetation",
         help="Broad description of the project footprint, informed by aerial imagery and field observations. This includes identifying whether the project is located within a regeneration or planted area, which are typically characterized by long, straight rows of trees. The Plans report will also provide additional detail on footprint features, including wetlands and other relevant environmental constraints."
     )
@@ -1234,8 +787,7 @@ if st.session_state.show_salvage_form:
     )
 
     # --- NEW: compact stacked totals box under waiver question ---
-    total_c_load_display = sum(e["C_Load"] for e in st.session_state.results_log if e.get("C_Load") is not None)
-    total_d_load_display = sum(e["D_Load"] for e in st.session_state.results_log if e.get("D_Load") is not None)
+    totals = st.session_state.results_log.totals()
 
     st.markdown(
         f"""
@@ -1247,16 +799,14 @@ if st.session_state.show_salvage_form:
                     display:inline-block;
                     font-size:13px;
                     line-height:1.4;'>
-            <b>Total Deciduous Load:</b> {total_d_load_display:.5f}<br>
-            <b>Total Coniferous Load:</b> {total_c_load_display:.5f}
+            <b>Total Deciduous Load:</b> {totals.d_load:.5f}<br>
+            <b>Total Coniferous Load:</b> {totals.c_load:.5f}
         </div>
         """,
         unsafe_allow_html=True
     )
 
     # ✅ NEW FEATURE: Autofill waiver justification when "Yes" is selected (without overwriting user edits)
-    DEFAULT_WAIVER_JUSTIFICATION = "Timber salvage is not considered economically viable, given that the estimated volume is below 0.5 truckloads."
-
     if salvage_waiver == "Yes":
         if "justification" not in st.session_state or not str(st.session_state.justification).strip():
             st.session_state.justification = DEFAULT_WAIVER_JUSTIFICATION
@@ -1264,569 +814,134 @@ if st.session_state.show_salvage_form:
         justification = st.text_area("Provide justification:", key="justification")
 
     def fill_template():
-        # --- calculate grouped percentages ---
-        raw_con = (
-            sum(e["dom_pct"] for e in st.session_state.results_log if e["dom_sp"] in conifers)
-            + sum(e["sec_pct"] for e in st.session_state.results_log if e["sec_sp"] in conifers)
-        )
-        raw_dec = (
-            sum(e["dom_pct"] for e in st.session_state.results_log if e["dom_sp"] in deciduous)
-            + sum(e["sec_pct"] for e in st.session_state.results_log if e["sec_sp"] in deciduous)
+        fields = salvage_report_fields(
+            st.session_state.results_log.totals(),
+            disposition,
+            legal_loc,
+            vegetation,
+            other_specify_details,
+            st.session_state.is_merch,
+            disposition_fma,
+            no_disposition_fma,
+            salvage_waiver,
+            justification if salvage_waiver == "Yes" else ""
         )
+        report_bytes = render_report(fields, disposition_rows(st.session_state.ctlr_list))
+        return report_bytes, report_filename(disposition)
 
-        pct_con = round(raw_con / (raw_con + raw_dec) * 100, 0) if (raw_con + raw_dec) > 0 else 0
-
-        # conifer splits
-        spruce_raw = (
-            sum(e["dom_pct"] for e in st.session_state.results_log if e["dom_sp"] in {"Sw", "Sb"})
-            + sum(e["sec_pct"] for e in st.session_state.results_log if e["sec_sp"] in {"Sw", "Sb"})
-        )
-        pine_raw = (
-            sum(e["dom_pct"] for e in st.session_state.results_log if e["dom_sp"] == "P")
-            + sum(e["sec_pct"] for e in st.session_state.results_log if e["sec_sp"] == "P")
+    if st.button(
+        "Done (Generate Report)",
+        help="Save Timber form and convert to PDF. Provide to the form to AIM Lands staff and they can submit it to the FMA."
+    ):
+        report_bytes, filename = fill_template()
+        st.success("Report generated!")
+        # Served from memory through Streamlit's media endpoint; "ignore" keeps the button
+        # on the page after the download instead of rerunning the app.
+        st.download_button(
+            label="📥 Download report",
+            data=report_bytes,
+            file_name=filename,
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            on_click="ignore"
         )
-        other_con = raw_con - spruce_raw - pine_raw
 
-        if raw_con > 0:
-            spruce_pct = int(round(spruce_raw / raw_con * 100, 0))
-            pine_pct = int(round(pine_raw / raw_con * 100, 0))
-            other_con_pct = int(round(100 - spruce_pct - pine_pct, 0))
-        else:
-            spruce_pct = pine_pct = other_con_pct = 0
 
-        # deciduous splits
-        aspen_raw = (
-            sum(e["dom_pct"] for e in st.session_state.results_log if e["dom_sp"] == "Aw")
-            + sum(e["sec_pct"] for e in st.session_state.results_log if e["sec_sp"] == "Aw")
-        )
-        other_dec = raw_dec - aspen_raw
+# --- Bulk reports for multiple dispositions ---
+def read_table(name, data):
+    """Read an uploaded table: .csv or .xlsx as a DataFrame, a zipped shapefile or .gpkg as a GeoDataFrame."""
+    suffix = name.lower().rsplit(".", 1)[-1]
+    if suffix == "csv":
+        return pd.read_csv(io.BytesIO(data))
+    if suffix == "xlsx":
+        return pd.read_excel(io.BytesIO(data))
+
+    import geopandas as gpd
+    return gpd.read_file(io.BytesIO(data))
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def build_bulk_reports(dispositions_name, dispositions_bytes, stands_name, stands_bytes, default_region):
+    """Zip of one report per disposition, plus a summary row and any warnings for each."""
+    forms = read_disposition_table(read_table(dispositions_name, dispositions_bytes))
+    if not forms:
+        raise ValueError("The dispositions table has no rows with a disposition.")
+
+    stands = read_table(stands_name, stands_bytes)
+    dispositions = stand_dispositions(stands)
+    stand_results = calculate_avi_and_volumes_batch(build_stand_inputs(stands, default_region=default_region))
+    totals = totals_by_disposition(stand_results, dispositions)
+
+    jobs = bulk_report_jobs(forms, totals)
+    zip_bytes = render_reports_zip(jobs, template=load_report_template())
+
+    summary = []
+    for form, (filename, _, _) in zip(forms, jobs):
+        form_totals = totals.get(form["disposition"])
+        summary.append({
+            "Disposition": form["disposition"],
+            "Stands": form_totals.entries if form_totals else 0,
+            "C_Vol": round(form_totals.c_vol, 1) if form_totals else 0.0,
+            "D_Vol": round(form_totals.d_vol, 1) if form_totals else 0.0,
+            "Report": filename,
+        })
+
+    warnings = [
+        f"{row['Disposition']}: no stands in the stand table, so its report has no volumes."
+        for row in summary if row["Stands"] == 0
+    ]
+    unmatched = sorted(set(totals) - {form["disposition"] for form in forms})
+    if unmatched:
+        warnings.append(f"Stands for dispositions not in the table were left out: {', '.join(unmatched)}")
 
-        if raw_dec > 0:
-            aspen_pct = int(round(aspen_raw / raw_dec * 100, 0))
-            other_dec_pct = int(round(100 - aspen_pct, 0))
-        else:
-            aspen_pct = other_dec_pct = 0
-
-        # --- determine coniferous class checkbox ---
-        def con_class_box(label):
-            if label == "D" and pct_con < 30:
-                return "☒"
-            elif label == "C" and pct_con > 70:
-                return "☒"
-            elif label == "CD" and 50 <= pct_con <= 70:
-                return "☒"
-            elif label == "DC" and 30 <= pct_con < 50:
-                return "☒"
-            return "☐"
-
-        # --- now build the Word file with adjusted formatting ---
-        doc = Document()
-
-        # Title
-        p = doc.add_paragraph()
-        p.alignment = 1
-        run = p.add_run("Vegetation and Timber Salvage Information")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(11)
-        run.font.bold = True
-        run.font.underline = True
-        p.paragraph_format.space_after = Pt(0)
-
-        # Disposition
-        p = doc.add_paragraph()
-        p.alignment = 1
-        r1 = p.add_run("Disposition: ")
-        r1.font.name = "Times New Roman"
-        r1.font.size = Pt(10)
-        r1.font.bold = True
-        r2 = p.add_run(disposition)
-        r2.font.name = "Times New Roman"
-        r2.font.size = Pt(10)
-        r2.font.bold = False
-        p.paragraph_format.space_after = Pt(0)
-
-        # Legal Land Location
-        p = doc.add_paragraph()
-        p.alignment = 1
-        r1 = p.add_run("Legal Land Location: ")
-        r1.font.name = "Times New Roman"
-        r1.font.size = Pt(10)
-        r1.font.bold = True
-        r2 = p.add_run(legal_loc)
-        r2.font.name = "Times New Roman"
-        r2.font.size = Pt(10)
-        r2.font.bold = False
-        p.paragraph_format.space_after = Pt(0)
-
-        # Horizontal line
-        p = doc.add_paragraph()
-        p_pr = p._p.get_or_add_pPr()
-        bdr = OxmlElement("w:pBdr")
-        bottom = OxmlElement("w:bottom")
-        bottom.set(qn("w:val"), "single")
-        bottom.set(qn("w:sz"), "24")
-        bottom.set(qn("w:space"), "1")
-        bottom.set(qn("w:color"), "000000")
-        bdr.append(bottom)
-        p_pr.append(bdr)
-
-        # Vegetation and Timber Cover header
-        p = doc.add_paragraph()
-        run = p.add_run("Vegetation and Timber Cover")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(12)
-        run.font.bold = True
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(6)
-
-        # Vegetation subheader
-        p = doc.add_paragraph()
-        run = p.add_run("Vegetation (check all that apply)")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-
-        # Paired checkboxes with formatting
-        def box(l):
-            return "☒" if l in vegetation else "☐"
-
-        rows = [
-            ("Native grassland", "Treed wetland"),
-            ("Tame pasture", "Shrubby wetland"),
-            ("Cropland", "Grass or grass-like wetland"),
-            ("Sparsely or non-vegetated", "Native aspen parkland"),
-            ("Cutblock - planted", "Other (specify)"),
-        ]
-
-        for left, right in rows:
-            p = doc.add_paragraph()
-            p.paragraph_format.space_before = Pt(0)
-            p.paragraph_format.space_after = Pt(0)
-
-            left_indent = "" if left in [
-                "Native grassland",
-                "Tame pasture",
-                "Cropland",
-                "Sparsely or non-vegetated",
-                "Cutblock - planted"
-            ] else "\t"
-
-            right_indent = (
-                "\t\t" if left in ["Tame pasture", "Cropland"]
-                else "\t" if left not in ["Sparsely or non-vegetated", "Tame pasture", "Cropland"]
-                else ""
-            )
+    return zip_bytes, summary, warnings
 
-            if right == "Treed wetland":
-                extra_text = "\t\t"
-                run = p.add_run(f"{left_indent}{box(left)} {left}{right_indent}\t{box(right)} {right}{extra_text}")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-
-                run = p.add_run("Deciduous-dominant Forest:")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-                run.font.underline = True
-
-            elif right == "Shrubby wetland":
-                run = p.add_run(
-                    f"{left_indent}{box(left)} {left}{right_indent}\t{box(right)} {right}\t\t{con_class_box('D')} D less than 30% coniferous"
-                )
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-
-            elif right == "Grass or grass-like wetland":
-                extra_text = "\t"
-                run = p.add_run(f"{left_indent}{box(left)} {left}{right_indent}\t{box(right)} {right}{extra_text}")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-
-                run = p.add_run("Coniferous-dominant Forest:")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-                run.font.underline = True
-
-            elif right == "Native aspen parkland":
-                run = p.add_run(
-                    f"{left_indent}{box(left)} {left}{right_indent}\t{box(right)} {right}\t\t{con_class_box('C')} C More than 70% coniferous"
-                )
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-
-            elif right == "Other (specify)":
-                run = p.add_run(f"{left_indent}{box(left)} {left}{right_indent}\t{box(right)} {right}")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-
-                if "Other (specify)" in vegetation and other_specify_details:
-                    run = p.add_run(": ")
-                    run.font.name = "Times New Roman"
-                    run.font.size = Pt(10)
-                    run.font.bold = True
-
-                    run = p.add_run(other_specify_details)
-                    run.font.name = "Times New Roman"
-                    run.font.size = Pt(10)
-                    run.font.bold = False
-                    run.font.underline = True
-
-                run = p.add_run("\t\t")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-
-                run = p.add_run("Mixedwood Forest:")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-                run.font.underline = True
 
-            else:
-                run = p.add_run(f"{left_indent}{box(left)} {left}{right_indent}\t{box(right)} {right}")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run(
-            f"{box('Natural regeneration >2m')} Natural regeneration >2m\t\t\t\t\t{con_class_box('CD')} CD 70% to 50% coniferous"
+with st.expander("Bulk reports for multiple dispositions (optional)"):
+    dispositions_file = st.file_uploader(
+        "Dispositions table (.csv or .xlsx)",
+        type=["csv", "xlsx"],
+        key="bulk_dispositions_file",
+        help=(
+            "One row per disposition with columns disposition, legal_loc, vegetation (types separated by ;, or one "
+            "yes/no column per vegetation type), other_specify, is_merch, disposition_fma, no_disposition_fma, "
+            "ctlr (e.g. CTL: 123 Holder; DTL: 456 Holder), salvage_waiver and justification. Only disposition "
+            "is required."
+        )
+    )
+    bulk_stands_file = st.file_uploader(
+        "Stands for all dispositions (.zip shapefile, .gpkg or .csv)",
+        type=["zip", "gpkg", "csv"],
+        key="bulk_stands_file",
+        help=(
+            "The same stand fields as Import stand polygons, plus a disposition field naming the disposition "
+            "each stand belongs to. Each report's volumes and species mix come from its own stands."
         )
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run(f"\t\t\t\t\t\t\t\t{con_class_box('DC')} DC 50% to 30% coniferous")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        # Timber Salvage header
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(6)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run("Timber Salvage:")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-        run.font.underline = True
-
-        # 1. Merchantable timber...
-        yes = "☒" if is_merch == "Yes" else "☐"
-        no = "☒" if is_merch == "No" else "☐"
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(6)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run(f"1.\tMerchantable timber present?   {yes} Yes    {no} No")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run("\tProvide a volume inventory as follows:")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        total_c_vol = sum(e["C_Vol"] for e in st.session_state.results_log if e["C_Vol"] is not None)
-        total_c_load = sum(e["C_Load"] for e in st.session_state.results_log if e["C_Load"] is not None)
-        total_d_vol = sum(e["D_Vol"] for e in st.session_state.results_log if e["D_Vol"] is not None)
-        total_d_load = sum(e["D_Load"] for e in st.session_state.results_log if e["D_Load"] is not None)
-
-        # Round volume and load to one decimal place using math.ceil
-        total_c_vol = math.ceil(total_c_vol * 10) / 10
-        total_c_load = math.ceil(total_c_load * 10) / 10
-        total_d_vol = math.ceil(total_d_vol * 10) / 10
-        total_d_load = math.ceil(total_d_load * 10) / 10
-
-        # Coniferous volume
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run1 = p.add_run("\tConiferous approx. volume: ")
-        run1.font.name = "Times New Roman"
-        run1.font.size = Pt(10)
-        run1.font.bold = True
-        run2 = p.add_run(f"{total_c_vol:.1f}")
-        run2.font.name = "Times New Roman"
-        run2.font.size = Pt(10)
-        run2.font.bold = False
-        run2.font.underline = True
-        run3 = p.add_run(" m³")
-        run3.font.name = "Times New Roman"
-        run3.font.size = Pt(10)
-        run3.font.bold = False
-        run3.font.underline = True
-        run4 = p.add_run("  or  ")
-        run4.font.name = "Times New Roman"
-        run4.font.size = Pt(10)
-        run4.font.bold = True
-        run5 = p.add_run(f"{total_c_load:.1f}")
-        run5.font.name = "Times New Roman"
-        run5.font.size = Pt(10)
-        run5.font.bold = False
-        run5.font.underline = True
-        run6 = p.add_run(" loads")
-        run6.font.name = "Times New Roman"
-        run6.font.size = Pt(10)
-        run6.font.bold = False
-        run6.font.underline = True
-
-        # Coniferous species percentages
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run1 = p.add_run("\tSpruce ")
-        run1.font.name = "Times New Roman"
-        run1.font.size = Pt(10)
-        run1.font.bold = True
-        run2 = p.add_run(f"{spruce_pct}%")
-        run2.font.name = "Times New Roman"
-        run2.font.size = Pt(10)
-        run2.font.bold = False
-        run2.font.underline = True
-        run3 = p.add_run("    Pine ")
-        run3.font.name = "Times New Roman"
-        run3.font.size = Pt(10)
-        run3.font.bold = True
-        run4 = p.add_run(f"{pine_pct}%")
-        run4.font.name = "Times New Roman"
-        run4.font.size = Pt(10)
-        run4.font.bold = False
-        run4.font.underline = True
-        run5 = p.add_run("    Other ")
-        run5.font.name = "Times New Roman"
-        run5.font.size = Pt(10)
-        run5.font.bold = True
-        run6 = p.add_run(f"{other_con_pct}%")
-        run6.font.name = "Times New Roman"
-        run6.font.size = Pt(10)
-        run6.font.bold = False
-        run6.font.underline = True
-
-        # Deciduous volume
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run1 = p.add_run("\tDeciduous approx. volume: ")
-        run1.font.name = "Times New Roman"
-        run1.font.size = Pt(10)
-        run1.font.bold = True
-        run2 = p.add_run(f"{total_d_vol:.1f}")
-        run2.font.name = "Times New Roman"
-        run2.font.size = Pt(10)
-        run2.font.bold = False
-        run2.font.underline = True
-        run3 = p.add_run(" m³")
-        run3.font.name = "Times New Roman"
-        run3.font.size = Pt(10)
-        run3.font.bold = False
-        run3.font.underline = True
-        run4 = p.add_run("  or  ")
-        run4.font.name = "Times New Roman"
-        run4.font.size = Pt(10)
-        run4.font.bold = True
-        run5 = p.add_run(f"{total_d_load:.1f}")
-        run5.font.name = "Times New Roman"
-        run5.font.size = Pt(10)
-        run5.font.bold = False
-        run5.font.underline = True
-        run6 = p.add_run(" loads")
-        run6.font.name = "Times New Roman"
-        run6.font.size = Pt(10)
-        run6.font.bold = False
-        run6.font.underline = True
-
-        # Deciduous species percentages
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run1 = p.add_run("\tAspen ")
-        run1.font.name = "Times New Roman"
-        run1.font.size = Pt(10)
-        run1.font.bold = True
-        run2 = p.add_run(f"{aspen_pct}%")
-        run2.font.name = "Times New Roman"
-        run2.font.size = Pt(10)
-        run2.font.bold = False
-        run2.font.underline = True
-        run3 = p.add_run("    Other ")
-        run3.font.name = "Times New Roman"
-        run3.font.size = Pt(10)
-        run3.font.bold = True
-        run4 = p.add_run(f"{other_dec_pct}%")
-        run4.font.name = "Times New Roman"
-        run4.font.size = Pt(10)
-        run4.font.bold = False
-        run4.font.underline = True
-
-        # Section 2: Timber disposition or FMA(s)
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(6)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run("2.\tSpecify the timber disposition or FMA(s) shown on LSAS:")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run(f"\t{'☒' if no_disposition_fma else '☐'} No disposition (Contact SRD field office)")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run("\tDisposition number & Holder name of FMA: ")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-        run = p.add_run(disposition_fma)
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = False
-        run.font.underline = True
-
-        # Handle multiple CTLR entries
-        for ctlr in st.session_state.ctlr_list:
-            if ctlr["type"].strip() or ctlr["number_holder"].strip():
-                p = doc.add_paragraph()
-                p.paragraph_format.space_before = Pt(0)
-                p.paragraph_format.space_after = Pt(0)
-                run = p.add_run(f"\tDisposition number & Holder name of {ctlr['type']}: ")
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = True
-                run = p.add_run(ctlr["number_holder"])
-                run.font.name = "Times New Roman"
-                run.font.size = Pt(10)
-                run.font.bold = False
-                run.font.underline = True
-
-        # Section 3: Utilization Standards
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(6)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run("3.\tUtilization Standards:")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run1 = p.add_run("\tConiferous ")
-        run1.font.name = "Times New Roman"
-        run1.font.size = Pt(10)
-        run1.font.bold = True
-        run2 = p.add_run("15")
-        run2.font.name = "Times New Roman"
-        run2.font.size = Pt(10)
-        run2.font.bold = False
-        run2.font.underline = True
-        run3 = p.add_run(" cm stump diameter to a ")
-        run3.font.name = "Times New Roman"
-        run3.font.size = Pt(10)
-        run3.font.bold = True
-        run4 = p.add_run("11")
-        run4.font.name = "Times New Roman"
-        run4.font.size = Pt(10)
-        run4.font.bold = False
-        run4.font.underline = True
-        run5 = p.add_run(" cm top diameter.")
-        run5.font.name = "Times New Roman"
-        run5.font.size = Pt(10)
-        run5.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run1 = p.add_run("\tDeciduous ")
-        run1.font.name = "Times New Roman"
-        run1.font.size = Pt(10)
-        run1.font.bold = True
-        run2 = p.add_run("15")
-        run2.font.name = "Times New Roman"
-        run2.font.size = Pt(10)
-        run2.font.bold = False
-        run2.font.underline = True
-        run3 = p.add_run(" cm stump diameter to a ")
-        run3.font.name = "Times New Roman"
-        run3.font.size = Pt(10)
-        run3.font.bold = True
-        run4 = p.add_run("10")
-        run4.font.name = "Times New Roman"
-        run4.font.size = Pt(10)
-        run4.font.bold = False
-        run4.font.underline = True
-        run5 = p.add_run(" cm top diameter.")
-        run5.font.name = "Times New Roman"
-        run5.font.size = Pt(10)
-        run5.font.bold = True
-
-        # Section 4: Timber salvage waiver
-        box_yes = "☒" if salvage_waiver == "Yes" else "☐"
-        box_no = "☒" if salvage_waiver == "No" else "☐"
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(6)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run(f"4.\tTimber salvage waiver requested?   {box_yes} Yes   {box_no} No")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        p = doc.add_paragraph()
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
-        run = p.add_run("\tIf ‘Yes’, provide justification: ")
-        run.font.name = "Times New Roman"
-        run.font.size = Pt(10)
-        run.font.bold = True
-
-        if salvage_waiver == "Yes":
-            run = p.add_run(justification)
-            run.font.name = "Times New Roman"
-            run.font.size = Pt(10)
-            run.font.bold = False
-            run.font.underline = True
-
-        filename = f"Timber_Damage_Assessment_{disposition if disposition.strip() else 'Report'}.docx"
-        tmp = NamedTemporaryFile(delete=False, suffix=".docx")
-        doc.save(tmp.name)
-        return tmp.name, filename
+    )
 
-    if st.button(
-        "Done (Generate Report)",
-        help="Save Timber form and convert to PDF. Provide to the form to AIM Lands staff and they can submit it to the FMA."
-    ):
-        out_path, filename = fill_template()
-        if out_path:
-            st.success("Report generated!")
-            with open(out_path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode()
-                st.markdown(
-                    f'<a href="data:application/octet-stream;base64,{b64}" download="{filename}">📥 Download report</a>',
-                    unsafe_allow_html=True
+    if dispositions_file is not None and bulk_stands_file is not None:
+        if st.button("Generate All Reports", key="bulk_generate"):
+            try:
+                with st.spinner("Generating reports..."):
+                    bulk_zip, bulk_summary, bulk_warnings = build_bulk_reports(
+                        dispositions_file.name,
+                        dispositions_file.getvalue(),
+                        bulk_stands_file.name,
+                        bulk_stands_file.getvalue(),
+                        st.session_state.region
+                    )
+            except Exception as e:
+                st.error(f"Could not generate reports: {type(e).__name__}: {e}")
+            else:
+                st.success(f"{len(bulk_summary)} reports generated.")
+                for warning in bulk_warnings:
+                    st.warning(warning)
+                st.dataframe(bulk_summary, hide_index=True, use_container_width=True)
+                st.download_button(
+                    label="📥 Download all reports (Zip)",
+                    data=bulk_zip,
+                    file_name="timber_salvage_reports.zip",
+                    mime="application/zip",
+                    on_click="ignore"
                 )
 
 
@@ -1838,11 +953,6 @@ if st.button("Reset All Entries"):
 
 
 # --- SharePoint P3 Map Finder in Sidebar ---
-st.sidebar.header("P3 Map Finder")
-st.sidebar.markdown(
-    "Enter an ATS/LSD location or P3 code, then open the matching P3 search in SharePoint."
-)
-
 SHAREPOINT_SEARCH_BASE_URL = "https://aimland.sharepoint.com/sites/enviro/_layouts/15/search.aspx/siteall?q="
 SHAREPOINT_P3_FOLDER_URL = "https://aimland.sharepoint.com/sites/enviro/Shared%20Documents/Forms/AllItems.aspx?id=%2Fsites%2Fenviro%2FShared%20Documents%2F%5FTRAINING%20DOCUMENTS%2FTIMBER%2FP3%20Maps&viewid=c3a8e947%2Db321%2D45ec%2D94db%2D2f8cc840aca8"
 
@@ -1857,325 +967,330 @@ def convert_lsd_to_p3_sidebar(value):
         return direct_match.group(1)
 
     # Match ATS/LSD format, for example NE-20-48-11-W5 or 20-48-11-W5
-    pattern = r"^(?:[A-Za-z]{2}-)?\d{1,2}-\d{1,3}-\d{1,2}-[Ww](\d)$"
-    match = re.match(pattern, value, re.IGNORECASE)
+    code = parse_ats_text(value)
+    if code is not None:
+        return ats_code_to_p3(code)
 
-    if match:
-        meridian = match.group(1)
-        parts = value.replace(" ", "-").split("-")
-        range_num = parts[-2]
-        township = parts[-3]
+    return None
 
-        range_padded = range_num.zfill(2)
-        township_padded = township.zfill(3)
 
-        return f"{meridian}{range_padded}{township_padded}"
+@st.fragment
+def p3_map_finder():
+    """Sidebar P3 finder; its own fragment so typing a location doesn't rerun the page."""
+    st.header("P3 Map Finder")
+    st.markdown(
+        "Enter an ATS/LSD location or P3 code, then open the matching P3 search in SharePoint."
+    )
 
-    return None
+    p3_sidebar_input = st.text_input(
+        "Enter ATS/LSD or P3 code",
+        placeholder="NE-20-48-11-W5 or P3:511048*",
+        key="p3_sidebar_input"
+    )
 
+    if p3_sidebar_input:
+        p3_code_sidebar = convert_lsd_to_p3_sidebar(p3_sidebar_input)
 
-p3_sidebar_input = st.sidebar.text_input(
-    "Enter ATS/LSD or P3 code",
-    placeholder="NE-20-48-11-W5 or P3:511048*",
-    key="p3_sidebar_input"
-)
+        if p3_code_sidebar:
+            p3_search_text = f"P3:{p3_code_sidebar}*"
+            encoded_search_text = quote(p3_search_text)
+            sharepoint_search_url = f"{SHAREPOINT_SEARCH_BASE_URL}{encoded_search_text}"
 
-if p3_sidebar_input:
-    p3_code_sidebar = convert_lsd_to_p3_sidebar(p3_sidebar_input)
+            st.success(f"Search code: {p3_search_text}")
 
-    if p3_code_sidebar:
-        p3_search_text = f"P3:{p3_code_sidebar}*"
-        encoded_search_text = quote(p3_search_text)
-        sharepoint_search_url = f"{SHAREPOINT_SEARCH_BASE_URL}{encoded_search_text}"
+            st.link_button(
+                "Open generated P3 search in SharePoint",
+                sharepoint_search_url,
+                use_container_width=True
+            )
 
-        st.sidebar.success(f"Search code: {p3_search_text}")
+            st.markdown(
+                f"[Open P3 Maps folder]({SHAREPOINT_P3_FOLDER_URL})"
+            )
 
-        st.sidebar.link_button(
-            "Open generated P3 search in SharePoint",
-            sharepoint_search_url,
-            use_container_width=True
-        )
+            st.caption(
+                "The SharePoint search uses the generated P3 code above, not the original ATS/LSD input."
+            )
+        else:
+            st.warning("Could not read that input. Try NE-20-48-11-W5 or P3:511048*.")
 
-        st.sidebar.markdown(
-            f"[Open P3 Maps folder]({SHAREPOINT_P3_FOLDER_URL})"
-        )
 
-        st.sidebar.caption(
-            "The SharePoint search uses the generated P3 code above, not the original ATS/LSD input."
-        )
-    else:
-        st.sidebar.warning("Could not read that input. Try NE-20-48-11-W5 or P3:511048*.")
+with st.sidebar:
+    p3_map_finder()
+
 
 # --- Shapefile Dissolver in Sidebar ---
-st.sidebar.header("Shapefile Dissolver Tool")
-st.sidebar.markdown("Drag and drop ZIP files containing shapefiles to dissolve them into a single unified feature. This tool merges features that are split by attributes into one.")
-
-natural_regions_gdf, natural_regions_path, natural_regions_error = load_natural_regions_layer()
-if natural_regions_gdf is None:
-    st.sidebar.warning("Natural Regions layer not loaded.")
-else:
-    st.sidebar.success("Natural Regions layer loaded.")
-
-ats_gdf, ats_path, ats_error = load_ats_layer()
-if ats_gdf is None:
-    st.sidebar.warning("ATS layer not loaded.")
-    st.sidebar.caption(f"Looking for: {ats_path}")
-    st.sidebar.caption(f"Error: {ats_error}")
-
-
-# --- NEW: metadata inputs for output attribute table ---
-st.sidebar.subheader("Output Attributes")
-project_code = st.sidebar.text_input(
-    "Project Code (Project_Co)",
-    key="project_code_sidebar",
-    help="This value will be written to the output shapefile attribute table as Project_Co."
-)
+def apply_footprint_autofill(result):
+    """
+    Queue the Natural Region, Area and Legal Land Location from a processed footprint for the main form.
+    Returns True when something changed and the app needs a rerun to show it.
+    """
+    # --- Autofill logic ---
+    # These are applied on the next rerun because Streamlit widgets have already been created.
+    # They only update automatically when the field is blank/default or still equals the last auto-filled value.
+    # This means the user can manually change Natural Region, Area, or Legal Land Location and it will not be overwritten.
+    auto_fill_needs_rerun = False
+    region_text = result["region"]
+    calculated_area_ha = result["area_ha"]
+    ats_text = result["ats"]
+
+    if region_text in ["Boreal", "Foothills"]:
+        current_region = str(st.session_state.get("region", default_values["region"])).strip()
+        last_auto_region = str(st.session_state.get("last_auto_region", "")).strip()
+        if current_region == last_auto_region or not last_auto_region:
+            if current_region != region_text:
+                st.session_state.pending_auto_region = region_text
+                auto_fill_needs_rerun = True
+            else:
+                st.session_state.last_auto_region = region_text
 
-add_date = st.sidebar.date_input(
-    "Add Date (Add_Date)",
-    value=datetime.date.today(),
-    key="add_date_sidebar",
-    help="Defaults to today's date. Written to output as YYYY-MM-DD."
-)
+    if calculated_area_ha > 0:
+        try:
+            current_area = float(st.session_state.get("area", default_values["area"]))
+        except Exception:
+            current_area = float(default_values["area"])
 
-uploaded_files = st.sidebar.file_uploader(
-    "Upload .zip files",
-    type=["zip"],
-    accept_multiple_files=True,
-    help="Select or drag and drop .zip files containing shapefiles."
-)
+        last_auto_area = st.session_state.get("last_auto_area", None)
+        current_area_is_default = abs(current_area - float(default_values["area"])) < 0.000001
+        current_area_is_last_auto = (
+            last_auto_area is not None
+            and abs(current_area - float(last_auto_area)) < 0.000001
+        )
 
-temp_base_dir = Path(tempfile.mkdtemp())
-output_dir = temp_base_dir / "dissolved_output"
-output_dir.mkdir(parents=True, exist_ok=True)
+        if current_area_is_default or current_area_is_last_auto:
+            if abs(current_area - calculated_area_ha) >= 0.000001:
+                st.session_state.pending_auto_area = calculated_area_ha
+                auto_fill_needs_rerun = True
+            else:
+                st.session_state.last_auto_area = calculated_area_ha
+
+    if ats_text and ats_text != "Not detected":
+        current_legal = str(st.session_state.get("legal_loc", default_values["legal_loc"])).strip()
+        last_auto_legal = str(st.session_state.get("last_auto_legal_loc", "")).strip()
+
+        # Fill Legal Land Location if blank, or update it when it still contains the prior auto-filled ATS.
+        # If the user manually edits the box, this will leave their manual text alone.
+        if current_legal == "" or current_legal == last_auto_legal:
+            if current_legal != ats_text:
+                st.session_state.pending_auto_legal_loc = ats_text
+                auto_fill_needs_rerun = True
+            else:
+                st.session_state.last_auto_legal_loc = ats_text
+
+    return auto_fill_needs_rerun
+
+
+def dissolver_batch_outputs(batch):
+    """Output zip bytes and processing log text for the zips in `batch` that have finished so far."""
+    log_lines = ["Processing started"]
+    output_files = {}
+    for job in batch.jobs:
+        if job.complete:
+            log_lines.extend(job.result["log"])
+            log_lines.append(f"{job.name}: {job.status} ({job.elapsed:.1f} s)")
+            output_files.update(job.result["files"])
+        elif job.status == "cancelled":
+            log_lines.append(f"Cancelled {job.name}")
+    log_text = "\n".join(log_lines) + "\n"
+
+    output_zip = io.BytesIO()
+    with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for name, data in output_files.items():
+            zipf.writestr(name, data)
+        zipf.writestr("processing_log.txt", log_text)
+
+    return output_zip.getvalue(), log_text
+
+
+def show_dissolver_status(batch):
+    """Progress bar and per-file status table (status, stage, elapsed time) for a dissolver batch."""
+    done = sum(job.complete for job in batch.jobs)
+    st.progress(done / len(batch.jobs), text=f"{done} of {len(batch.jobs)} zip files processed")
+    st.dataframe(
+        [
+            {"File": job.name, "Status": job.status, "Stage": job.stage, "Time (s)": round(job.elapsed, 1)}
+            for job in batch.jobs
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
 
-log_file = output_dir / "processing_log.txt"
-with open(log_file, "w") as log:
-    log.write("Processing started\n")
 
-auto_fill_needs_rerun = False
+def dissolver_batch_progress(batch):
+    """Polled while `batch` runs: live status, a cancel button and the results finished so far."""
+    if not batch.running:
+        # Finished: a full rerun shows the results and applies autofill to the main form.
+        st.rerun()
 
-if uploaded_files:
-    for uploaded_file in uploaded_files:
-        zip_path = temp_base_dir / uploaded_file.name
-        with open(zip_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+    show_dissolver_status(batch)
 
-        with open(log_file, "a") as log:
-            log.write(f"\nProcessing {zip_path.name}...\n")
-            st.sidebar.write(f"Processing {zip_path.name}...")
+    if batch.cancelled:
+        st.caption("Cancelling... zips already running in a worker will finish first.")
+    elif st.button("Cancel", key="dissolver_cancel"):
+        batch.cancel()
+        st.rerun()
 
-            zip_subdir = output_dir / zip_path.stem
-            zip_subdir.mkdir(exist_ok=True)
+    if any(job.complete for job in batch.jobs):
+        partial_zip, _ = dissolver_batch_outputs(batch)
+        st.download_button(
+            label="Download Completed Shapefiles (Zip)",
+            data=partial_zip,
+            file_name="dissolved_shapefiles_partial.zip",
+            mime="application/zip",
+            key="dissolver_partial_download"
+        )
 
-            temp_dir = temp_base_dir / f"temp_{zip_path.stem}"
-            temp_dir.mkdir(exist_ok=True)
 
-            try:
-                with zipfile.ZipFile(zip_path, "r") as z:
-                    z.extractall(temp_dir)
-                log.write(f"Extracted {zip_path.name} to {temp_dir}\n")
-
-                shapefiles = list(temp_dir.glob("*.shp"))
-                if not shapefiles:
-                    log.write(f"No shapefiles found in {zip_path.name}, skipping.\n")
-                    st.sidebar.warning(f"No shapefiles found in {zip_path.name}, skipping.")
-                    continue
-
-                if len(shapefiles) > 1:
-                    log.write(f"Warning: Multiple shapefiles found. Using: {shapefiles[0]}\n")
-                    st.sidebar.warning(f"Warning: Multiple shapefiles found. Using: {shapefiles[0]}")
-
-                # READ FILE
-                gdf = gpd.read_file(shapefiles[0])
-                log.write(f"Loaded shapefile: {shapefiles[0]}\n")
-
-                if gdf.empty:
-                    log.write("Uploaded shapefile is empty.\n")
-                    st.sidebar.warning("Uploaded shapefile is empty.")
-                    continue
-
-                if not gdf.geometry.type.str.contains("Polygon|MultiPolygon").any():
-                    log.write("No polygon geometries found.\n")
-                    st.sidebar.warning("No polygon geometries found.")
-                    continue
-
-                # SPLIT MULTIPART + CLEAN GEOMETRY
-                gdf = gdf.explode(ignore_index=True)
-                gdf = _clean_geometries(gdf)
-
-                if gdf.empty:
-                    log.write("No valid geometries after cleaning.\n")
-                    st.sidebar.warning("No valid geometries after cleaning.")
-                    continue
-
-                # --- UPDATED: merge ALL features into ONE polygon feature (dissolve internal boundaries) ---
-                dissolved_geom = _safe_union(gdf.geometry)
-                dissolved_gdf = gpd.GeoDataFrame(geometry=[dissolved_geom], crs=gdf.crs)
-
-                # ADD AREA_HA TO FINAL DISSOLVED OUTPUT
-                try:
-                    if dissolved_gdf.crs is None:
-                        dissolved_gdf["Area_ha"] = 0
-                        log.write("CRS missing — Area_ha and region lookup may be incorrect.\n")
-                        st.sidebar.warning("CRS missing — Area_ha and region lookup may be incorrect.")
-                    else:
-                        if getattr(dissolved_gdf.crs, "is_geographic", False):
-                            dissolved_area_gdf = dissolved_gdf.to_crs(epsg=3347)
-                        else:
-                            dissolved_area_gdf = dissolved_gdf
-
-                        dissolved_gdf["Area_ha"] = (dissolved_area_gdf.geometry.area / 10000).round(4)
-                        log.write("Area_ha field added successfully.\n")
-                except Exception as e:
-                    dissolved_gdf["Area_ha"] = 0
-                    log.write(f"Error calculating Area_ha: {str(e)}\n")
-                    st.sidebar.warning(f"Error calculating Area_ha: {str(e)}")
-
-                # --- Natural Region lookup from Alberta Natural Regions layer ---
-                # Keep sidebar display simple and only write the simplified Region field to output.
-                region_result = get_natural_region_overlap(dissolved_gdf, natural_regions_gdf)
-                region_text = str(region_result["tda_region"]).strip()
-
-                if not region_text:
-                    region_text = "Not detected"
-
-                dissolved_gdf["Region"] = region_text
-
-                # Simple sidebar display only.
-                st.sidebar.success(f"Region: {region_text}")
-
-                log.write(
-                    f"Region: {region_text}; "
-                    f"Raw NRNAME: {region_result['region_raw']}; "
-                    f"Subregion: {region_result['subregion_raw']}; "
-                    f"Overlap ha: {region_result['overlap_ha']}; "
-                    f"Confidence: {region_result['confidence']}\n"
-                )
+def show_layer_status(natural_regions_store, ats_layer, ats_path, ats_error):
+    if natural_regions_store is None:
+        st.warning("Natural Regions layer not loaded.")
+    else:
+        st.success("Natural Regions layer loaded.")
 
-                # --- ATS lookup from Alberta ATS layer ---
-                ats_result = get_ats_intersections(dissolved_gdf, ats_gdf)
-                ats_text = str(ats_result["ats_text"]).strip()
+    if ats_layer is None:
+        st.warning("ATS layer not loaded.")
+        st.caption(f"Looking for: {ats_path}")
+        st.caption(f"Error: {ats_error}")
 
-                if not ats_text:
-                    ats_text = "Not detected"
 
-                # Shapefile text fields can truncate long strings, so the processing log keeps the full list too.
-                dissolved_gdf["ATS"] = ats_text[:254]
-                st.sidebar.success(f"ATS: {ats_text}")
+def layer_warmup_progress(warmup):
+    """Polled while the reference layers load in the background; reruns the app once they are ready."""
+    if warmup.ready:
+        st.rerun()
 
-                log.write(
-                    f"ATS: {ats_text}; "
-                    f"ATS count: {ats_result['count']}; "
-                    f"Confidence: {ats_result['confidence']}\n"
-                )
+    for label, name in [("Natural Regions", "natural_regions"), ("ATS", "ats")]:
+        result = warmup.result(name)
+        if result is None:
+            st.info(f"⏳ Loading {label} layer... ({warmup.elapsed:.0f} s)")
+        elif result[0] is None:
+            st.warning(f"{label} layer not loaded.")
+        else:
+            st.success(f"{label} layer loaded.")
 
-                # --- Autofill main form fields from processed footprint ---
-                # These are applied on the next rerun so the widgets remain editable by the user.
-                try:
-                    calculated_area_ha = float(dissolved_gdf["Area_ha"].iloc[0])
-                except Exception:
-                    calculated_area_ha = 0.0
-
-                # --- Autofill logic ---
-                # These are applied on the next rerun because Streamlit widgets have already been created.
-                # They only update automatically when the field is blank/default or still equals the last auto-filled value.
-                # This means the user can manually change Natural Region, Area, or Legal Land Location and it will not be overwritten.
-
-                if region_text in ["Boreal", "Foothills"]:
-                    current_region = str(st.session_state.get("region", default_values["region"])).strip()
-                    last_auto_region = str(st.session_state.get("last_auto_region", "")).strip()
-                    if current_region == last_auto_region or not last_auto_region:
-                        if current_region != region_text:
-                            st.session_state.pending_auto_region = region_text
-                            auto_fill_needs_rerun = True
-                        else:
-                            st.session_state.last_auto_region = region_text
-
-                if calculated_area_ha > 0:
-                    try:
-                        current_area = float(st.session_state.get("area", default_values["area"]))
-                    except Exception:
-                        current_area = float(default_values["area"])
-
-                    last_auto_area = st.session_state.get("last_auto_area", None)
-                    current_area_is_default = abs(current_area - float(default_values["area"])) < 0.000001
-                    current_area_is_last_auto = (
-                        last_auto_area is not None
-                        and abs(current_area - float(last_auto_area)) < 0.000001
-                    )
 
-                    if current_area_is_default or current_area_is_last_auto:
-                        if abs(current_area - calculated_area_ha) >= 0.000001:
-                            st.session_state.pending_auto_area = calculated_area_ha
-                            auto_fill_needs_rerun = True
-                        else:
-                            st.session_state.last_auto_area = calculated_area_ha
-
-                if ats_text and ats_text != "Not detected":
-                    current_legal = str(st.session_state.get("legal_loc", default_values["legal_loc"])).strip()
-                    last_auto_legal = str(st.session_state.get("last_auto_legal_loc", "")).strip()
-
-                    # Fill Legal Land Location if blank, or update it when it still contains the prior auto-filled ATS.
-                    # If the user manually edits the box, this will leave their manual text alone.
-                    if current_legal == "" or current_legal == last_auto_legal:
-                        if current_legal != ats_text:
-                            st.session_state.pending_auto_legal_loc = ats_text
-                            auto_fill_needs_rerun = True
-                        else:
-                            st.session_state.last_auto_legal_loc = ats_text
-
-                # --- add required attribute fields to the single output feature ---
-                dissolved_gdf["Add_Date"] = add_date.strftime("%Y-%m-%d")
-                dissolved_gdf["Status"] = "1"
-                dissolved_gdf["Project_Co"] = str(project_code).strip()
-
-                out_file = zip_subdir / f"{zip_path.stem}_singlepolygon.shp"
-
-                dissolved_gdf.to_file(out_file)
-                log.write(f"Saved shapefile: {out_file}\n")
-                st.sidebar.success(f"✅ Saved shapefile: {out_file}")
+@st.fragment
+def shapefile_dissolver():
+    """
+    Sidebar dissolver. As a fragment, uploading or changing its inputs reruns
+    only this tool; autofill of the main form still triggers a full rerun.
+    """
+    st.header("Shapefile Dissolver Tool")
+    st.markdown("Drag and drop ZIP files containing shapefiles to dissolve them into a single unified feature. This tool merges features that are split by attributes into one.")
+
+    warmup = get_layer_warmup()
+    if warmup.ready:
+        # Already loaded by the warm-up, so these are cache hits (a changed layer file is reloaded here).
+        natural_regions_store, natural_regions_path, natural_regions_error = load_natural_regions_layer()
+        ats_layer, ats_path, ats_error = load_ats_layer()
+        show_layer_status(natural_regions_store, ats_layer, ats_path, ats_error)
+        st.caption(f"Reference layers ready (loaded in {warmup.elapsed:.0f} s at startup).")
+    else:
+        st.fragment(layer_warmup_progress, run_every=1.0)(warmup)
 
-            except Exception as e:
-                log.write(f"Error processing {zip_path.name}: {str(e)}\n")
-                st.sidebar.error(f"Error processing {zip_path.name}: {str(e)}")
-
-            finally:
-                if temp_dir.exists():
-                    shutil.rmtree(temp_dir)
-                    log.write(f"Cleaned up {temp_dir}\n")
-
-    output_zip_path = temp_base_dir / "dissolved_shapefiles.zip"
-    with zipfile.ZipFile(output_zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(output_dir):
-            for file in files:
-                zipf.write(
-                    os.path.join(root, file),
-                    os.path.relpath(os.path.join(root, file), output_dir)
+
+    # --- NEW: metadata inputs for output attribute table ---
+    st.subheader("Output Attributes")
+    project_code = st.text_input(
+        "Project Code (Project_Co)",
+        key="project_code_sidebar",
+        help="This value will be written to the output shapefile attribute table as Project_Co."
+    )
+
+    add_date = st.date_input(
+        "Add Date (Add_Date)",
+        value=datetime.date.today(),
+        key="add_date_sidebar",
+        help="Defaults to today's date. Written to output as YYYY-MM-DD."
+    )
+
+    uploaded_files = st.file_uploader(
+        "Upload .zip files",
+        type=["zip"],
+        accept_multiple_files=True,
+        help="Select or drag and drop .zip files containing shapefiles."
+    )
+
+    if uploaded_files and not warmup.ready:
+        st.info("Your files will be processed as soon as the reference layers have loaded.")
+    elif uploaded_files:
+        layers_key = footprint_layers_key(natural_regions_path, ats_path)
+        add_date_text = add_date.strftime("%Y-%m-%d")
+        project_code_text = str(project_code).strip()
+        footprint_cache = get_footprint_cache()
+
+        uploads = []
+        for uploaded_file in uploaded_files:
+            zip_bytes = uploaded_file.getvalue()
+            key = footprint_cache_key(zip_bytes, uploaded_file.name, project_code_text, add_date_text, layers_key)
+            uploads.append((uploaded_file.name, zip_bytes, key))
+
+        # One background batch per set of uploads. Results are cached by content,
+        # so only new or changed zips are processed; several at once go to the worker pool.
+        batch = st.session_state.get("dissolver_batch")
+        if batch is None or batch.signature != tuple(key for _, _, key in uploads):
+            if batch is not None:
+                batch.cancel()
+            new_zips = sum(footprint_cache.get(key) is None for _, _, key in uploads)
+            pool = None
+            if new_zips > 1 and FOOTPRINT_WORKERS > 1:
+                pool = get_footprint_pool(
+                    natural_regions_path if natural_regions_store is not None else "",
+                    str(ats_layer.path) if ats_layer is not None else "",
+                    layers_key
                 )
+            batch = DissolverBatch(
+                uploads, project_code_text, add_date_text, natural_regions_store, ats_layer, footprint_cache, pool
+            ).start()
+            st.session_state.dissolver_batch = batch
+
+        if batch.running:
+            st.fragment(dissolver_batch_progress, run_every=1.0)(batch)
+            return
 
-    with open(output_zip_path, "rb") as f:
-        st.sidebar.download_button(
-            label="Download All Shapefiles (Zip)",
-            data=f,
+        show_dissolver_status(batch)
+
+        auto_fill_needs_rerun = False
+        for job in batch.jobs:
+            if not job.complete:
+                continue
+            st.write(f"**{job.name}**")
+            for level, text in job.result["messages"]:
+                getattr(st, level)(text)
+            auto_fill_needs_rerun = apply_footprint_autofill(job.result) or auto_fill_needs_rerun
+
+        output_zip, log_text = dissolver_batch_outputs(batch)
+        all_complete = all(job.complete for job in batch.jobs)
+
+        st.download_button(
+            label="Download All Shapefiles (Zip)" if all_complete else "Download Completed Shapefiles (Zip)",
+            data=output_zip,
             file_name="dissolved_shapefiles.zip",
             mime="application/zip"
         )
 
-    with open(log_file, "rb") as f:
-        st.sidebar.download_button(
+        st.download_button(
             label="Download Processing Log",
-            data=f,
-            file_name=log_file.name,
+            data=log_text,
+            file_name="processing_log.txt",
             mime="text/plain"
         )
 
-    st.sidebar.success("🎉 All zip files processed.")
-
-    if auto_fill_needs_rerun:
-        st.rerun()
-
-
-# IMPORTANT: REMOVE THIS IF YOU WANT DOWNLOADS TO WORK RELIABLY
-# if temp_base_dir.exists():
-#     shutil.rmtree(temp_base_dir)
+        if all_complete:
+            st.success("🎉 All zip files processed.")
+        else:
+            done = sum(job.complete for job in batch.jobs)
+            stopped = "Cancelled" if batch.cancelled else "Stopped"
+            st.warning(f"{stopped} after {done} of {len(batch.jobs)} zip files.")
+            if st.button("Process Remaining Files", key="dissolver_resume"):
+                st.session_state.dissolver_batch = None
+                st.rerun()
+
+        if auto_fill_needs_rerun:
+            st.rerun()
+
+    elif st.session_state.get("dissolver_batch") is not None:
+        st.session_state.dissolver_batch.cancel()
+        st.session_state.dissolver_batch = None
+
+with st.sidebar:
+    shapefile_dissolver()
@@ -0,0 +1,103 @@
+"""
+Headless batch volume calculation for stand tables exported from QGIS.
+
+Reads a CSV, GeoPackage or shapefile of stands, runs the same AVI/TDA
+volume logic as the Streamlit form over every row, and writes AVI, C_Vol,
+D_Vol, C_Load and D_Load back as columns.
+
+Usage:
+    python avi_batch.py stands.shp
+    python avi_batch.py stands.csv -o stands_volumes.csv --region Boreal
+    python avi_batch.py stands.gpkg --layer timber --workers 8
+
+Field names are matched ignoring case, using the aliases in
+avi_calc.FIELD_ALIASES (shapefile-safe names such as DOM_PCT or CROWN_DENS
+work). If there is no area field, polygon area is computed in EPSG:3347
+(Canada equal-area).
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from avi_calc import build_stand_inputs, calculate_avi_and_volumes_batch
+
+
+OUTPUT_COLUMNS = ["AVI", "C_Vol", "D_Vol", "C_Load", "D_Load"]
+
+# Below this many stands a single process is faster than starting workers.
+PARALLEL_MIN_ROWS = 100000
+PARALLEL_CHUNK_ROWS = 50000
+
+
+def read_stands(path, layer=None):
+    """Read a stand table. CSV gives a DataFrame; spatial formats give a GeoDataFrame."""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        return pd.read_csv(path)
+
+    import geopandas as gpd
+    return gpd.read_file(path, layer=layer)
+
+
+def write_stands(stands, path, layer=None):
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        frame = stands.drop(columns="geometry") if "geometry" in stands.columns else stands
+        frame.to_csv(path, index=False)
+    else:
+        stands.to_file(path, layer=layer)
+
+
+def calculate_stands(inputs, workers=1, chunk_size=PARALLEL_CHUNK_ROWS):
+    """Run the batch calculator, split across worker processes for large tables."""
+    if workers <= 1 or len(inputs) < PARALLEL_MIN_ROWS:
+        return calculate_avi_and_volumes_batch(inputs)
+
+    chunks = [inputs.iloc[i:i + chunk_size] for i in range(0, len(inputs), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return pd.concat(pool.map(calculate_avi_and_volumes_batch, chunks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compute AVI codes, timber volumes and loads for every stand in a QGIS attribute table."
+    )
+    parser.add_argument("input", help="Stand table: .csv, .gpkg or .shp")
+    parser.add_argument("-o", "--output", help="Output file (default: <input>_volumes with the same extension)")
+    parser.add_argument("--layer", help="Layer name for multi-layer GeoPackages")
+    parser.add_argument("--region", help="Natural region (Boreal/Foothills) for stands without a region field")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for large inputs")
+    args = parser.parse_args(argv)
+
+    input_path = Path(args.input)
+    output_path = Path(args.output) if args.output else input_path.with_name(
+        f"{input_path.stem}_volumes{input_path.suffix}"
+    )
+
+    try:
+        stands = read_stands(input_path, layer=args.layer)
+        inputs = build_stand_inputs(stands, default_region=args.region)
+        results = calculate_stands(inputs, workers=args.workers)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    for column in OUTPUT_COLUMNS:
+        stands[column] = results[column]
+    write_stands(stands, output_path, layer=args.layer)
+
+    print(f"{len(stands)} stands written to {output_path}")
+    print(
+        f"Total C_Vol: {np.nansum(results['C_Vol']):.5f} m³  C_Load: {np.nansum(results['C_Load']):.5f}  "
+        f"D_Vol: {np.nansum(results['D_Vol']):.5f} m³  D_Load: {np.nansum(results['D_Load']):.5f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
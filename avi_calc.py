@@ -0,0 +1,669 @@
+"""
+AVI code and timber volume calculations, independent of the Streamlit app.
+
+The Streamlit form (avi_app.py) calls calculate_avi_and_volumes() for the
+stand being edited. calculate_avi_and_volumes_batch() runs the same rules
+over a whole table of stands at once, e.g. a QGIS attribute export.
+StandLog holds the saved stand entries and their totals for the tally and report.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# --- Species mapping ---
+species_names = {
+    "Sw": "White spruce",
+    "Sb": "Black spruce",
+    "P": "Pine",
+    "Fb": "Balsam fir",
+    "Fd": "Douglas fir",
+    "Lt": "Larch",
+    "Aw": "Aspen",
+    "Pb": "Balsam poplar",
+    "Bw": "White birch",
+}
+
+# ← For TDA logic:
+conifers = {"Sw", "Sb", "P", "Fb", "Fd", "Lt"}
+deciduous = {"Aw", "Pb", "Bw"}
+
+# One load is 40 m³.
+LOAD_M3 = 40
+
+
+# --- Load TDA tables ---
+# One workbook per natural region, e.g. BOREAL_TDA.xlsx, next to this module.
+TDA_FOLDER = Path(__file__).resolve().parent
+TDA_GROUPS = ("D", "MX-P", "MX-Sx", "C-Sw", "C-P", "C-Sb")
+
+
+@lru_cache(maxsize=None)
+def load_tda_lookup(region_key):
+    """
+    Reads one region's TDA table once per process and flattens it into
+    {(height_bin, density_class, group): total m³/ha}, so per-stand
+    lookups are a dict access instead of a DataFrame filter.
+    """
+    df = pd.read_excel(TDA_FOLDER / f"{region_key.upper()}_TDA.xlsx")
+    keys = df["Height_and_Density"].astype(str).str.strip().str.extract(r"^(.*?)\s*\((\w+)\)$")
+
+    lookup = {}
+    for group in TDA_GROUPS:
+        total_col = f"Total ({group})"
+        if total_col not in df.columns:
+            continue
+        for height_bin, density_class, total in zip(keys[0], keys[1], df[total_col].tolist()):
+            lookup[(height_bin, density_class, group)] = total
+    return lookup
+
+
+def tda_total(region, height_bin, density_class, group):
+    """Total volume (m³/ha) for a stand class, or 0 if the table has no such row/column."""
+    lookup = load_tda_lookup(str(region).strip().lower())
+    return lookup.get((height_bin, density_class, group), 0)
+
+
+# --- Stand classification ---
+def density_class(d):
+    return "AB" if 6 <= d <= 50 else "CD"
+
+
+def height_bin(h):
+    if h <= 4:
+        return "0-4"
+    if h <= 8:
+        return "5-8"
+    if h <= 10:
+        return "9-10"
+    if h <= 25:
+        return str(h)  # Single values for 9-25
+    if h <= 28:
+        return "26-28"
+    return "29+"
+
+
+def get_structure_group(dom_sp, dom_pct, sec_sp, sec_pct):
+    t_dec = (dom_pct if dom_sp in deciduous else 0) + (sec_pct if sec_sp in deciduous else 0)
+    t_con = (dom_pct if dom_sp in conifers else 0) + (sec_pct if sec_sp in conifers else 0)
+
+    if t_dec >= 70:
+        return "D"
+
+    if t_con >= 70:
+        if dom_sp == "Sw":
+            return "C-Sw"
+        if dom_sp == "P":
+            return "C-P"
+        if dom_sp == "Sb":
+            return "C-Sb"
+        # Fb, Fd, Lt, and other conifers do not have a C-Sx column in the TDA table.
+        # Use the available C-Sw conifer-dominant table instead of returning zero.
+        return "C-Sw"
+
+    if t_con > 30 and t_dec < 70:
+        if dom_sp == "P":
+            return "MX-P"
+        return "MX-Sx"
+
+    return None
+
+
+def build_avi_code(is_merch, crown_density, avg_stand_height, dom_species, dom_cover, sec_species, sec_cover):
+    avi_code = ""
+    if is_merch.lower() == "yes":
+        avi_code += "m"
+
+    if 6 <= crown_density <= 30:
+        avi_code += "A"
+    elif 31 <= crown_density <= 50:
+        avi_code += "B"
+    elif 51 <= crown_density <= 70:
+        avi_code += "C"
+    elif 71 <= crown_density <= 100:
+        avi_code += "D"
+
+    avi_code += str(avg_stand_height)
+    avi_code += dom_species + str(dom_cover // 10)
+
+    if dom_cover < 100 and sec_species:
+        avi_code += sec_species + str(sec_cover // 10)
+
+    return avi_code
+
+
+# --- Calculate AVI and volumes ---
+@dataclass(frozen=True)
+class StandResult:
+    """AVI code, per-hectare and total volumes, and loads for one stand."""
+    avi_code: str = ""
+    c_vol: float = 0
+    d_vol: float = 0
+    c_load: float = 0
+    d_load: float = 0
+    c_vol_ha: float = None  # None when the stand has no conifer cover
+    d_vol_ha: float = 0
+    group: str = None
+    total_val: float = 0
+
+
+def calculate_avi_and_volumes(
+    is_merch,
+    crown_density,
+    avg_stand_height,
+    dom_species,
+    dom_cover,
+    sec_species,
+    sec_cover,
+    area,
+    region
+):
+    """
+    Builds the AVI code and looks up TDA volumes for a single stand.
+    Raises if the region has no readable TDA table.
+    """
+    avi_code = build_avi_code(
+        is_merch, crown_density, avg_stand_height, dom_species, dom_cover, sec_species, sec_cover
+    )
+
+    group = get_structure_group(dom_species, dom_cover, sec_species, sec_cover)
+    total_val = tda_total(
+        region,
+        height_bin(avg_stand_height),
+        density_class(crown_density),
+        group if group in TDA_GROUPS else "D"
+    )
+
+    if dom_cover == 100:
+        c_vol_ha = total_val if dom_species in conifers else None
+        d_vol_ha = total_val if dom_species in deciduous else 0
+    else:
+        c_pct = (dom_cover if dom_species in conifers else 0) + (sec_cover if sec_species in conifers else 0)
+        d_pct = (dom_cover if dom_species in deciduous else 0) + (sec_cover if sec_species in deciduous else 0)
+
+        c_vol_ha = round((c_pct / 100) * total_val, 1) if c_pct > 0 else None
+        d_vol_ha = round((d_pct / 100) * total_val, 1) if d_pct > 0 else 0
+
+    c_vol = round(c_vol_ha * area, 5) if c_vol_ha is not None else 0
+    d_vol = round(d_vol_ha * area, 5) if d_vol_ha is not None else 0
+    c_load = round(c_vol / LOAD_M3, 5)
+    d_load = round(d_vol / LOAD_M3, 5)
+
+    return StandResult(avi_code, c_vol, d_vol, c_load, d_load, c_vol_ha, d_vol_ha, group, total_val)
+
+
+# --- Project totals ---
+SPRUCE = {"Sw", "Sb"}
+
+
+@dataclass(frozen=True)
+class ProjectTotals:
+    """Volume, load and species-cover sums over all saved stand entries."""
+    entries: int = 0
+    c_vol: float = 0
+    c_load: float = 0
+    d_vol: float = 0
+    d_load: float = 0
+    con_raw: float = 0  # summed dom/sec cover % of conifer species
+    dec_raw: float = 0
+    spruce_raw: float = 0
+    pine_raw: float = 0
+    aspen_raw: float = 0
+
+    @property
+    def pct_con(self):
+        total = self.con_raw + self.dec_raw
+        return round(self.con_raw / total * 100, 0) if total > 0 else 0
+
+    @property
+    def pct_dec(self):
+        total = self.con_raw + self.dec_raw
+        return round(self.dec_raw / total * 100, 0) if total > 0 else 0
+
+
+# --- Saved stand entries ---
+# Species are stored as indexes into SPECIES_CODES; 0 is "no species".
+SPECIES_CODES = ("",) + tuple(species_names)
+_SPECIES_INDEX = {code: i for i, code in enumerate(SPECIES_CODES)}
+_CONIFER_MASK = np.array([code in conifers for code in SPECIES_CODES])
+_DECIDUOUS_MASK = np.array([code in deciduous for code in SPECIES_CODES])
+_SPRUCE_MASK = np.array([code in SPRUCE for code in SPECIES_CODES])
+_PINE_MASK = np.array([code == "P" for code in SPECIES_CODES])
+_ASPEN_MASK = np.array([code == "Aw" for code in SPECIES_CODES])
+
+
+def _species_index(code):
+    try:
+        return _SPECIES_INDEX[code or ""]
+    except KeyError:
+        raise ValueError(f"Unknown species code {code!r}") from None
+
+
+class StandLog:
+    """
+    Saved stand entries, stored column-wise in typed numpy arrays.
+
+    Rows go in and come out as the entry dicts the app has always used
+    (C_Vol, C_Load, D_Vol, D_Load, dom_sp, dom_pct, sec_sp, sec_pct, is_merch,
+    crown_density, avg_stand_height, area, region), but totals() is a handful
+    of array operations and the session holds a few small arrays instead of
+    one dict per stand.
+    """
+    FLOAT_FIELDS = ("C_Vol", "C_Load", "D_Vol", "D_Load", "area")  # NaN means None
+    INT_FIELDS = ("dom_pct", "sec_pct", "crown_density", "avg_stand_height")
+    SPECIES_FIELDS = ("dom_sp", "sec_sp")
+    ENTRY_KEYS = (
+        "C_Vol", "C_Load", "D_Vol", "D_Load", "dom_sp", "dom_pct", "sec_sp", "sec_pct",
+        "is_merch", "crown_density", "avg_stand_height", "area", "region"
+    )
+
+    def __init__(self, capacity=16):
+        self._size = 0
+        self._regions = []  # the region column holds indexes into this list
+        self._columns = self._allocate(capacity)
+        self._totals = None
+
+    @classmethod
+    def _allocate(cls, capacity):
+        columns = {name: np.full(capacity, np.nan) for name in cls.FLOAT_FIELDS}
+        columns.update({name: np.zeros(capacity, dtype=np.int32) for name in cls.INT_FIELDS})
+        columns.update({name: np.zeros(capacity, dtype=np.int8) for name in cls.SPECIES_FIELDS})
+        columns["is_merch"] = np.ones(capacity, dtype=bool)
+        columns["region"] = np.zeros(capacity, dtype=np.int16)
+        return columns
+
+    def _reserve(self, size):
+        capacity = len(self._columns["area"])
+        if size <= capacity:
+            return
+        grown = self._allocate(max(size, capacity * 2))
+        for name, values in self._columns.items():
+            grown[name][:self._size] = values[:self._size]
+        self._columns = grown
+
+    def _region_index(self, region):
+        region = "" if region is None else str(region)
+        if region not in self._regions:
+            self._regions.append(region)
+        return self._regions.index(region)
+
+    def _check_index(self, i):
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("stand entry index out of range")
+        return i
+
+    def _write(self, i, entry):
+        columns = self._columns
+        for name in self.FLOAT_FIELDS:
+            value = entry.get(name)
+            columns[name][i] = np.nan if value is None else value
+        for name in self.INT_FIELDS:
+            columns[name][i] = entry.get(name) or 0
+        for name in self.SPECIES_FIELDS:
+            columns[name][i] = _species_index(entry.get(name))
+        columns["is_merch"][i] = bool(entry.get("is_merch", True))
+        columns["region"][i] = self._region_index(entry.get("region"))
+        self._totals = None
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        i = self._check_index(i)
+        columns = self._columns
+        entry = {}
+        for name in self.ENTRY_KEYS:
+            value = columns[name][i]
+            if name in self.FLOAT_FIELDS:
+                entry[name] = None if np.isnan(value) else float(value)
+            elif name in self.SPECIES_FIELDS:
+                entry[name] = SPECIES_CODES[value]
+            elif name == "region":
+                entry[name] = self._regions[value]
+            elif name == "is_merch":
+                entry[name] = bool(value)
+            else:
+                entry[name] = int(value)
+        return entry
+
+    def __setitem__(self, i, entry):
+        self._write(self._check_index(i), entry)
+
+    def __delitem__(self, i):
+        i = self._check_index(i)
+        for values in self._columns.values():
+            values[i:self._size - 1] = values[i + 1:self._size]
+        self._size -= 1
+        self._totals = None
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def append(self, entry):
+        self._reserve(self._size + 1)
+        self._write(self._size, entry)
+        self._size += 1
+
+    def extend_frame(self, frame):
+        """
+        Append every row of a calculate_avi_and_volumes_batch result at once.
+        Blank values are saved as the batch calculator read them: no species, 0 cover.
+        """
+        dom_codes = frame["dom_sp"].fillna("").astype(str).str.strip()
+        sec_codes = frame["sec_sp"].fillna("").astype(str).str.strip()
+        dom_sp = dom_codes.map(_SPECIES_INDEX)
+        sec_sp = sec_codes.map(_SPECIES_INDEX)
+        unknown = sorted(set(dom_codes[dom_sp.isna()]) | set(sec_codes[sec_sp.isna()]))
+        if unknown:
+            raise ValueError(f"Unknown species codes: {', '.join(map(str, unknown))}")
+
+        start, stop = self._size, self._size + len(frame)
+        self._reserve(stop)
+        columns = self._columns
+        for name in self.FLOAT_FIELDS:
+            columns[name][start:stop] = pd.to_numeric(frame[name], errors="coerce").to_numpy(dtype=float)
+        for name in self.INT_FIELDS:
+            columns[name][start:stop] = np.round(frame[name].fillna(0).to_numpy(dtype=float))
+        columns["dom_sp"][start:stop] = dom_sp.to_numpy()
+        columns["sec_sp"][start:stop] = sec_sp.to_numpy()
+        if "is_merch" in frame:
+            columns["is_merch"][start:stop] = _merch_flags(frame["is_merch"])
+        else:
+            columns["is_merch"][start:stop] = True
+        regions = frame["region"].fillna("").astype(str).str.strip()
+        columns["region"][start:stop] = regions.map({r: self._region_index(r) for r in regions.unique()})
+        self._size = stop
+        self._totals = None
+
+    def totals(self):
+        """ProjectTotals for the saved entries, cached until the next change."""
+        if self._totals is None:
+            n = self._size
+            columns = self._columns
+
+            def column_sum(name):
+                values = columns[name][:n]
+                # Python's left-to-right sum, as the per-entry totals always used, so
+                # the ceil-rounded report figures can't shift by a float ulp.
+                return sum(values[~np.isnan(values)].tolist())
+
+            species = np.concatenate([columns["dom_sp"][:n], columns["sec_sp"][:n]])
+            cover = np.concatenate([columns["dom_pct"][:n], columns["sec_pct"][:n]])
+
+            def cover_sum(mask):
+                return int(cover[mask[species]].sum())
+
+            self._totals = ProjectTotals(
+                n,
+                column_sum("C_Vol"),
+                column_sum("C_Load"),
+                column_sum("D_Vol"),
+                column_sum("D_Load"),
+                cover_sum(_CONIFER_MASK),
+                cover_sum(_DECIDUOUS_MASK),
+                cover_sum(_SPRUCE_MASK),
+                cover_sum(_PINE_MASK),
+                cover_sum(_ASPEN_MASK),
+            )
+        return self._totals
+
+
+# --- Batch calculation ---
+STAND_INPUT_COLUMNS = [
+    "dom_sp", "dom_pct", "sec_sp", "sec_pct", "crown_density", "avg_stand_height", "area", "region"
+]
+
+# The per-stand attributes a plain polygon layer (areas only) does not have.
+STAND_ATTRIBUTE_COLUMNS = ["dom_sp", "dom_pct", "sec_sp", "sec_pct", "crown_density", "avg_stand_height"]
+
+
+# Stand input column -> accepted field names in the input table, in order of preference.
+FIELD_ALIASES = {
+    "dom_sp": ["dom_sp", "dom_species", "dom_spec", "sp1"],
+    "dom_pct": ["dom_pct", "dom_cover", "dom_cov", "sp1_pct", "sp1_per"],
+    "sec_sp": ["sec_sp", "sec_species", "sec_spec", "sp2"],
+    "sec_pct": ["sec_pct", "sec_cover", "sec_cov", "sp2_pct", "sp2_per"],
+    "crown_density": ["crown_density", "crown_dens", "crown_den", "density"],
+    "avg_stand_height": ["avg_stand_height", "avg_height", "stand_hgt", "height"],
+    "area": ["area", "area_ha", "hectares"],
+    "region": ["region", "tdaregion", "nat_region"],
+    "is_merch": ["is_merch", "merch"],
+}
+
+
+def _find_field(columns, possible_names):
+    """Find a field ignoring case."""
+    lower_lookup = {c.lower(): c for c in columns}
+    for name in possible_names:
+        if name.lower() in lower_lookup:
+            return lower_lookup[name.lower()]
+    return None
+
+
+def has_stand_attributes(columns):
+    """True if any stand attribute field (species, cover, density, height) is present."""
+    return any(_find_field(columns, FIELD_ALIASES[c]) is not None for c in STAND_ATTRIBUTE_COLUMNS)
+
+
+def polygon_area_ha(stands):
+    """Equal-area (EPSG:3347) hectares for every polygon in one vectorized pass."""
+    if stands.crs is None:
+        raise ValueError("Input layer has no CRS, so polygon area cannot be computed.")
+    return (stands.geometry.to_crs(epsg=3347).area / 10000).round(4)
+
+
+def build_stand_inputs(stands, default_region=None):
+    """
+    Map the input table's fields onto the calculator's stand columns.
+    Species values like "Sw (White spruce)" or "SW" are reduced to their
+    code; a ValueError lists any code not in species_names.
+    """
+    inputs = pd.DataFrame(index=stands.index)
+    for column, aliases in FIELD_ALIASES.items():
+        field = _find_field(stands.columns, aliases)
+        if field is not None:
+            inputs[column] = stands[field]
+
+    # Single-species tables: no second species, and the cover split follows the form's sliders.
+    if "sec_sp" not in inputs:
+        inputs["sec_sp"] = ""
+    if "sec_pct" not in inputs and "dom_pct" in inputs:
+        inputs["sec_pct"] = 100 - inputs["dom_pct"]
+
+    if "area" not in inputs and "geometry" in stands.columns:
+        inputs["area"] = polygon_area_ha(stands)
+
+    if default_region:
+        if "region" in inputs:
+            blank = inputs["region"].isna() | (inputs["region"].astype(str).str.strip() == "")
+            inputs["region"] = inputs["region"].mask(blank, default_region)
+        else:
+            inputs["region"] = default_region
+
+    missing = [c for c in STAND_INPUT_COLUMNS if c not in inputs]
+    if missing:
+        raise ValueError(
+            f"Input is missing fields for {missing}. Accepted names: "
+            + "; ".join(f"{c}: {', '.join(FIELD_ALIASES[c])}" for c in missing)
+        )
+
+    # Exports often upper- or lower-case the codes (SW, aw); map them back onto species_names.
+    canonical = {"": ""}
+    canonical.update((code.lower(), code) for code in species_names)
+    unknown = set()
+    for column in ["dom_sp", "sec_sp"]:
+        codes = inputs[column].fillna("").astype(str).str.strip().str.split(" ").str[0]
+        inputs[column] = codes.str.lower().map(canonical)
+        unknown.update(codes[inputs[column].isna()])
+    if unknown:
+        raise ValueError(f"Unknown species codes: {', '.join(sorted(unknown))}")
+
+    return inputs
+
+
+@lru_cache(maxsize=None)
+def _tda_frame(region_key):
+    """A region's TDA lookup as a long table, for merging against many stands."""
+    rows = [
+        (region_key, height, density, group, total)
+        for (height, density, group), total in load_tda_lookup(region_key).items()
+    ]
+    return pd.DataFrame(rows, columns=["_region", "_height_bin", "_density_class", "_group", "TDA_Total"])
+
+
+def _species_pct(species, pct, members):
+    return np.where(species.isin(members), pct, 0)
+
+
+MERCH_TRUE_VALUES = {"yes", "y", "true", "1"}
+
+
+def _is_merch(value):
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    # Blank means the form's default, "Yes".
+    if value is None or pd.isna(value):
+        return True
+    if isinstance(value, (int, float, np.number)):
+        return value == 1
+    text = str(value).strip().lower()
+    return text == "" or text in MERCH_TRUE_VALUES
+
+
+def _merch_flags(values):
+    """
+    An is_merch column as a bool array: Yes/Y/True/1 in any case, a real
+    True, or a blank value (the form's default) is merchantable.
+    """
+    return np.array([_is_merch(v) for v in values.tolist()], dtype=bool)
+
+
+def _round(values, ndigits):
+    """
+    Python's round() over an array. np.round can differ from round() in the
+    last digit, and batch results must match the single-stand path exactly.
+    """
+    return np.array([round(v, ndigits) for v in values.tolist()], dtype=float)
+
+
+def calculate_avi_and_volumes_batch(stands):
+    """
+    Runs calculate_avi_and_volumes over every row of a stand table at once.
+
+    `stands` needs the STAND_INPUT_COLUMNS (species codes, percents, crown
+    density, height, area in ha, natural region); an optional is_merch
+    column (Yes/Y/True/1 is merchantable, anything else is not) defaults
+    to "Yes", as do its blank values. Returns a copy of the table with AVI,
+    Group, TDA_Total, C_Vol_ha, D_Vol_ha, C_Vol, D_Vol, C_Load and D_Load
+    columns added. Raises ValueError if a required column is missing or a
+    region has no TDA table.
+    """
+    missing = [c for c in STAND_INPUT_COLUMNS if c not in stands.columns]
+    if missing:
+        raise ValueError(f"Missing stand columns: {missing}")
+
+    out = stands.copy()
+    dom_sp = out["dom_sp"].fillna("").astype(str).str.strip()
+    sec_sp = out["sec_sp"].fillna("").astype(str).str.strip()
+    dom_pct = out["dom_pct"].fillna(0).round().astype(int).to_numpy()
+    sec_pct = out["sec_pct"].fillna(0).round().astype(int).to_numpy()
+    crown = out["crown_density"].fillna(0).round().astype(int).to_numpy()
+    height = out["avg_stand_height"].fillna(0).round().astype(int).to_numpy()
+    area = out["area"].fillna(0).astype(float).to_numpy()
+    region_key = out["region"].fillna("").astype(str).str.strip().str.lower()
+
+    if "is_merch" in out.columns:
+        merch = _merch_flags(out["is_merch"])
+    else:
+        merch = np.ones(len(out), dtype=bool)
+
+    # AVI code
+    density_letter = np.select(
+        [(crown >= 6) & (crown <= 30), (crown >= 31) & (crown <= 50), (crown >= 51) & (crown <= 70), (crown >= 71) & (crown <= 100)],
+        ["A", "B", "C", "D"],
+        "",
+    )
+    has_sec = (dom_pct < 100) & (sec_sp != "").to_numpy()
+    sec_part = (sec_sp + pd.Series(sec_pct // 10, index=out.index).astype(str)).where(has_sec, "")
+    out["AVI"] = (
+        pd.Series(np.where(merch, "m", ""), index=out.index)
+        + pd.Series(density_letter, index=out.index)
+        + pd.Series(height, index=out.index).astype(str)
+        + dom_sp
+        + pd.Series(dom_pct // 10, index=out.index).astype(str)
+        + sec_part
+    )
+
+    # Structure group
+    t_dec = _species_pct(dom_sp, dom_pct, deciduous) + _species_pct(sec_sp, sec_pct, deciduous)
+    t_con = _species_pct(dom_sp, dom_pct, conifers) + _species_pct(sec_sp, sec_pct, conifers)
+    dom_np = dom_sp.to_numpy()
+    group = np.select(
+        [
+            t_dec >= 70,
+            (t_con >= 70) & (dom_np == "Sb"),
+            (t_con >= 70) & (dom_np == "P"),
+            t_con >= 70,
+            (t_con > 30) & (dom_np == "P"),
+            t_con > 30,
+        ],
+        ["D", "C-Sb", "C-P", "C-Sw", "MX-P", "MX-Sx"],
+        "",
+    )
+    out["Group"] = np.where(group == "", None, group)
+
+    # TDA totals via one merge per batch
+    height_bins = np.select(
+        [height <= 4, height <= 8, height <= 10, height <= 25, height <= 28],
+        ["0-4", "5-8", "9-10", height.astype(str), "26-28"],
+        "29+",
+    )
+    keys = pd.DataFrame({
+        "_region": region_key.to_numpy(),
+        "_height_bin": height_bins,
+        "_density_class": np.where((crown >= 6) & (crown <= 50), "AB", "CD"),
+        "_group": np.where(group == "", "D", group),
+    })
+
+    tables = []
+    unknown = []
+    for key in keys["_region"].unique():
+        try:
+            tables.append(_tda_frame(key))
+        except (OSError, ValueError):
+            unknown.append(key)
+    if unknown:
+        raise ValueError(f"No TDA table for region(s): {unknown}")
+
+    # Like tda_total: a missing TDA row gives 0, a blank TDA cell stays NaN.
+    merged = keys.merge(pd.concat(tables), how="left", on=list(keys.columns), indicator=True)
+    total = np.where(merged["_merge"] == "both", merged["TDA_Total"].to_numpy(dtype=float), 0)
+    out["TDA_Total"] = total
+
+    # Volumes and loads
+    full_cover = dom_pct == 100
+    dom_is_con = dom_sp.isin(conifers).to_numpy()
+    dom_is_dec = dom_sp.isin(deciduous).to_numpy()
+    has_con = np.where(full_cover, dom_is_con, t_con > 0)
+    c_vol_ha = np.where(full_cover, total, _round(t_con / 100 * total, 1))
+    d_vol_ha = np.where(
+        full_cover,
+        np.where(dom_is_dec, total, 0),
+        np.where(t_dec > 0, _round(t_dec / 100 * total, 1), 0),
+    )
+    c_vol = np.where(has_con, _round(c_vol_ha * area, 5), 0)
+    d_vol = _round(d_vol_ha * area, 5)
+
+    out["C_Vol_ha"] = np.where(has_con, c_vol_ha, np.nan)
+    out["D_Vol_ha"] = d_vol_ha
+    out["C_Vol"] = c_vol
+    out["D_Vol"] = d_vol
+    out["C_Load"] = _round(c_vol / LOAD_M3, 5)
+    out["D_Load"] = _round(d_vol / LOAD_M3, 5)
+    return out
@@ -0,0 +1,1280 @@
+"""
+Footprint processing for the Shapefile Dissolver: Natural Region and ATS
+lookups, and dissolving an uploaded footprint zip into a single polygon.
+
+Kept free of Streamlit so worker processes can import it, and geopandas
+is imported inside the functions that read or build layers, so importing
+this module on a cold start stays light. avi_app.py wraps the layer
+loaders in st.cache_resource, runs them once per process on a
+LayerWarmup thread, and keeps processed results in a FootprintCache. A
+DissolverBatch processes one set of uploads on a background thread with
+per-file status, stage and cancellation; when several new zips are
+uploaded at once it spreads them over a FootprintPool of worker
+processes, each holding its own copy of the reference layers.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from workspace import scratch_dir
+
+
+# --- Natural Region spatial lookup ---
+# Put the Alberta Natural Regions/Subregions shapefile files in your repo here:
+# Regions/
+#   REGIONS.shp
+#   REGIONS.shx
+#   REGIONS.dbf
+#   REGIONS.prj
+#   REGIONS.cpg
+#
+# This loader is case-flexible. It will use REGIONS.shp, regions.shp,
+# or the first .shp it finds inside the Regions folder.
+REGION_LAYER_FOLDER = Path(__file__).resolve().parent / "Regions"
+
+
+def find_region_layer_path():
+    """Find the Natural Regions shapefile in the repo, regardless of filename case."""
+    if not REGION_LAYER_FOLDER.exists():
+        return None
+
+    preferred_names = ["REGIONS.shp", "regions.shp", "Regions.shp"]
+    for name in preferred_names:
+        candidate = REGION_LAYER_FOLDER / name
+        if candidate.exists():
+            return candidate
+
+    shp_files = sorted(REGION_LAYER_FOLDER.glob("*.shp"))
+    if shp_files:
+        return shp_files[0]
+
+    return None
+
+
+def get_region_folder_files():
+    """Small debug helper for Streamlit Cloud path issues."""
+    if not REGION_LAYER_FOLDER.exists():
+        return []
+    return sorted([p.name for p in REGION_LAYER_FOLDER.iterdir()])
+
+
+def _safe_union(geo_series):
+    """Works with both older and newer GeoPandas versions."""
+    try:
+        return geo_series.union_all()
+    except AttributeError:
+        return geo_series.unary_union
+
+
+def _clean_geometries(gdf):
+    """Fix simple invalid geometries and remove empty/null geometries."""
+    gdf = gdf.copy()
+    gdf = gdf[gdf.geometry.notna()]
+    gdf = gdf[~gdf.geometry.is_empty]
+    if gdf.empty:
+        return gdf
+
+    try:
+        gdf["geometry"] = gdf.geometry.make_valid()
+    except Exception:
+        gdf["geometry"] = gdf.geometry.buffer(0)
+
+    gdf = gdf[gdf.geometry.notna()]
+    gdf = gdf[~gdf.geometry.is_empty]
+    return gdf
+
+
+def _find_field(gdf, possible_names):
+    """Find a field ignoring case."""
+    lower_lookup = {c.lower(): c for c in gdf.columns}
+    for name in possible_names:
+        if name.lower() in lower_lookup:
+            return lower_lookup[name.lower()]
+    return None
+
+
+def normalize_tda_region_name(nrname):
+    """
+    Converts Alberta NRNAME text into the simplified TDA table region names used by this app.
+    Add more mappings here if you later add more TDA tables.
+    """
+    text = str(nrname or "").lower()
+
+    if "boreal" in text:
+        return "Boreal"
+    if "foothill" in text:
+        return "Foothills"
+
+    # Outside current TDA options. Keep the original name so you can see it.
+    return str(nrname or "").strip()
+
+
+def _layer_cache_key(path):
+    """Cache key for a layer file: path plus mtime and size, so edits on disk invalidate the cache."""
+    stat = Path(path).stat()
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+class NaturalRegionsStore:
+    """
+    Natural Regions layer prepared once for overlap queries.
+
+    Holds the cleaned layer in its native CRS and in EPSG:3347 (Canada
+    equal-area), plus an STRtree over the equal-area copy. A footprint lookup
+    only has to reproject the small uploaded footprint and query the index.
+    """
+
+    EQUAL_AREA_EPSG = 3347
+
+    def __init__(self, regions_gdf):
+        if regions_gdf.crs is None:
+            raise ValueError("Region layer CRS missing")
+
+        native = _clean_geometries(regions_gdf).reset_index(drop=True)
+        equal_area = native.to_crs(epsg=self.EQUAL_AREA_EPSG)
+        # Reprojection can introduce self-intersections; repair in place so rows stay aligned with native.
+        equal_area["geometry"] = equal_area.geometry.make_valid()
+
+        self.native = native
+        self.equal_area = equal_area
+        self.nr_field = _find_field(native, ["NRNAME", "Natural_Region", "NAT_REGION", "REGION"])
+        self.nsr_field = _find_field(native, ["NSRNAME", "Natural_Subregion", "SUBREGION", "NSR_NAME"])
+        self.tree = equal_area.sindex
+
+    @property
+    def crs(self):
+        return self.native.crs
+
+    @property
+    def empty(self):
+        return self.native.empty
+
+    def __len__(self):
+        return len(self.native)
+
+
+def read_natural_regions_store(path):
+    """Read the Natural Regions layer from disk and prepare it for overlap queries."""
+    import geopandas as gpd
+    return NaturalRegionsStore(gpd.read_file(path))
+
+
+def get_natural_region_overlap(project_gdf, regions):
+    """
+    Returns the natural region/subregion that has the largest spatial overlap
+    with the uploaded project shapefile.
+
+    `regions` is a NaturalRegionsStore; a plain GeoDataFrame is prepared on the fly.
+    """
+    import geopandas as gpd
+
+    empty_result = {
+        "region_raw": "",
+        "subregion_raw": "",
+        "tda_region": "",
+        "overlap_ha": 0,
+        "confidence": "Not found",
+        "all_overlaps": pd.DataFrame()
+    }
+
+    if regions is None or regions.empty:
+        empty_result["confidence"] = "Region layer missing"
+        return empty_result
+
+    if project_gdf is None or project_gdf.empty:
+        empty_result["confidence"] = "Uploaded layer empty"
+        return empty_result
+
+    if project_gdf.crs is None:
+        empty_result["confidence"] = "Uploaded layer CRS missing"
+        return empty_result
+
+    if isinstance(regions, gpd.GeoDataFrame):
+        if regions.crs is None:
+            empty_result["confidence"] = "Region layer CRS missing"
+            return empty_result
+        regions = NaturalRegionsStore(regions)
+
+    project = _clean_geometries(project_gdf)
+
+    if project.empty or regions.empty:
+        empty_result["confidence"] = "No valid geometry"
+        return empty_result
+
+    nr_field = regions.nr_field
+    nsr_field = regions.nsr_field
+
+    if nr_field is None:
+        empty_result["confidence"] = "NRNAME field missing"
+        return empty_result
+
+    try:
+        # Only the footprint is reprojected; the region layer is already held in equal-area CRS.
+        project_eq = project.to_crs(epsg=NaturalRegionsStore.EQUAL_AREA_EPSG)
+        project_geom_eq = _safe_union(project_eq.geometry)
+
+        hits = regions.tree.query(project_geom_eq, predicate="intersects")
+        candidates = regions.native.iloc[hits]
+        candidates_eq = regions.equal_area.iloc[hits]
+
+        if candidates.empty:
+            empty_result["confidence"] = "No overlap"
+            return empty_result
+
+        # One bulk intersection over the candidate array instead of a per-polygon loop.
+        overlap_ha = candidates_eq.geometry.intersection(project_geom_eq).area.to_numpy() / 10000
+        has_overlap = overlap_ha > 0
+
+        if not has_overlap.any():
+            empty_result["confidence"] = "No measurable overlap"
+            return empty_result
+
+        hit_rows = candidates[has_overlap]
+        region_raw = hit_rows[nr_field].astype(str).str.strip().to_numpy()
+        subregion_raw = hit_rows[nsr_field].astype(str).str.strip().to_numpy() if nsr_field else ""
+
+        overlaps = pd.DataFrame({
+            "NRNAME": region_raw,
+            "NSRNAME": subregion_raw,
+            "Overlap_Ha": overlap_ha[has_overlap].round(4),
+        })
+        overlaps["TDARegion"] = overlaps["NRNAME"].map(
+            {name: normalize_tda_region_name(name) for name in overlaps["NRNAME"].unique()}
+        )
+        overlaps = (
+            overlaps
+            .groupby(["NRNAME", "NSRNAME", "TDARegion"], dropna=False, as_index=False)["Overlap_Ha"]
+            .sum()
+            .sort_values("Overlap_Ha", ascending=False)
+        )
+
+        top = overlaps.iloc[0]
+        confidence = "Single region" if len(overlaps) == 1 else "Multiple regions - largest overlap used"
+
+        return {
+            "region_raw": top["NRNAME"],
+            "subregion_raw": top["NSRNAME"],
+            "tda_region": top["TDARegion"],
+            "overlap_ha": float(top["Overlap_Ha"]),
+            "confidence": confidence,
+            "all_overlaps": overlaps
+        }
+
+    except Exception as e:
+        empty_result["confidence"] = f"Error: {e}"
+        return empty_result
+
+
+# --- ATS spatial lookup ---
+# GitHub/Streamlit repo setup expected:
+# ATS/
+#   ATS_QRT.zip
+# The ZIP can contain either:
+#   ATS_QRT.gpkg
+# or shapefile pieces such as .shp, .shx, .dbf, .prj, etc.
+ATS_LAYER_FOLDER = Path(__file__).resolve().parent / "ATS"
+ATS_LAYER_ZIP_NAME = "ATS_QRT.zip"
+
+# Extracted copies of the ATS zip are kept in a folder this app owns under
+# TIMBER_ATS_CACHE_DIR (e.g. a persistent volume), one folder per zip content hash,
+# so restarts and other workers reuse the same extraction instead of unzipping again.
+ATS_CACHE_ROOT = Path(os.environ.get("TIMBER_ATS_CACHE_DIR", ATS_LAYER_FOLDER / ".extracted"))
+ATS_CACHE_DIR = ATS_CACHE_ROOT / "timber_ats"
+ATS_EXTRACT_COMPLETE_MARKER = ".complete"
+ATS_EXTRACTION_NAME_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+
+# Extractions of other zips are only removed once nothing has used them for this
+# long, since another deploy sharing the cache may still be reading its copy.
+# The complete marker's mtime records the last use.
+ATS_CACHE_TTL_SECONDS = int(os.environ.get("TIMBER_ATS_CACHE_TTL", 7 * 24 * 3600))
+ATS_MARK_USED_INTERVAL_SECONDS = 3600
+
+# Slim copy of the ATS layer written next to the extraction: geometry, the finished
+# ATS_LABEL and integer-coded label parts. Bump the version when its columns change.
+ATS_PREPARED_NAME = "ATS_PREPARED_v2.gpkg"
+
+# ATS locations are packed into one integer laid out as decimal digits M RR TTT SS Q
+# (meridian, range, township, section, quarter code), e.g. SW-12-076-06-W5 -> 506076124.
+# Sorting the codes orders results by meridian, range, township, section, then quarter,
+# and code // 1000 is the P3 map number MRRTTT.
+ATS_QUARTER_CODES = {"NE": 1, "NW": 2, "SE": 3, "SW": 4}
+ATS_QUARTER_NAMES = {code: name for name, code in ATS_QUARTER_CODES.items()}
+ATS_TEXT_PATTERN = re.compile(r"^(?:([A-Za-z]{2})-)?(\d{1,2})-(\d{1,3})-(\d{1,2})-[Ww](\d)$")
+
+
+def find_ats_zip_path():
+    """Find the ATS zip in the repo, with a flexible fallback."""
+    preferred = ATS_LAYER_FOLDER / ATS_LAYER_ZIP_NAME
+    if preferred.exists():
+        return preferred
+
+    if ATS_LAYER_FOLDER.exists():
+        zip_files = sorted(ATS_LAYER_FOLDER.glob("*.zip"))
+        if zip_files:
+            return zip_files[0]
+
+    return preferred
+
+
+def get_ats_folder_files():
+    """Small debug helper for Streamlit Cloud path/LFS issues."""
+    if not ATS_LAYER_FOLDER.exists():
+        return []
+    return sorted([p.name for p in ATS_LAYER_FOLDER.iterdir()])
+
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    """Content hash of a file, read in chunks so large zips are not loaded into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _mark_ats_extraction_used(extract_dir):
+    """Refresh the last-use time of an extraction so other deploys' cleanup leaves it alone."""
+    try:
+        os.utime(Path(extract_dir) / ATS_EXTRACT_COMPLETE_MARKER)
+    except OSError:
+        pass
+
+
+def _cleanup_stale_ats_extractions(keep_name, ttl=ATS_CACHE_TTL_SECONDS):
+    """
+    Remove extractions of other ATS zips that have been idle for longer than
+    `ttl` seconds, plus ats_layer_* temp dirs of the same age left behind by
+    earlier versions of this app. Only hash-named folders and our own staging
+    dirs are touched.
+    """
+    now = time.time()
+
+    if ATS_CACHE_DIR.exists():
+        for child in ATS_CACHE_DIR.iterdir():
+            if child.name == keep_name:
+                continue
+            try:
+                if ATS_EXTRACTION_NAME_PATTERN.match(child.name):
+                    marker = child / ATS_EXTRACT_COMPLETE_MARKER
+                    last_used = (marker if marker.exists() else child).stat().st_mtime
+                    if now - last_used > ttl:
+                        shutil.rmtree(child, ignore_errors=True)
+                # Another worker may be mid-extraction; leave young staging dirs alone.
+                elif child.name.startswith(".tmp-") and now - child.stat().st_mtime > 3600:
+                    shutil.rmtree(child, ignore_errors=True)
+            except OSError:
+                pass
+
+    for legacy_dir in Path(tempfile.gettempdir()).glob("ats_layer_*"):
+        try:
+            if legacy_dir.is_dir() and now - legacy_dir.stat().st_mtime > ttl:
+                shutil.rmtree(legacy_dir, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def extract_ats_zip(ats_zip_path):
+    """
+    Return a folder holding the extracted ATS zip, extracting only if this
+    exact zip content has not been extracted before.
+    """
+    content_hash = _file_sha256(ats_zip_path)[:16]
+    extract_dir = ATS_CACHE_DIR / content_hash
+
+    if not (extract_dir / ATS_EXTRACT_COMPLETE_MARKER).exists():
+        ATS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+        # Extract to a private folder and rename into place, so a half-written
+        # extraction is never picked up by another worker.
+        staging_dir = Path(tempfile.mkdtemp(prefix=f".tmp-{content_hash}-", dir=ATS_CACHE_DIR))
+        try:
+            with zipfile.ZipFile(ats_zip_path, "r") as z:
+                z.extractall(staging_dir)
+            (staging_dir / ATS_EXTRACT_COMPLETE_MARKER).touch()
+            if not (extract_dir / ATS_EXTRACT_COMPLETE_MARKER).exists():
+                # Clear out a partial extraction left by a crashed worker, if any.
+                shutil.rmtree(extract_dir, ignore_errors=True)
+                os.replace(staging_dir, extract_dir)
+        except OSError:
+            # Another worker finished the same extraction first.
+            if not (extract_dir / ATS_EXTRACT_COMPLETE_MARKER).exists():
+                raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    else:
+        _mark_ats_extraction_used(extract_dir)
+
+    _cleanup_stale_ats_extractions(keep_name=content_hash)
+    return extract_dir
+
+
+class AtsLayer:
+    """
+    Lazy handle on the extracted ATS layer.
+
+    No features are held in memory. Each query reads only the features whose
+    bounding box overlaps the footprint, which a GeoPackage answers from its
+    own R-tree index, so a worker can serve requests without ever loading the
+    province-wide layer.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        import geopandas as gpd
+
+        # One feature is enough to learn the CRS and field names.
+        sample = gpd.read_file(self.path, rows=1)
+        self.crs = sample.crs
+        self.columns = list(sample.columns)
+        self.empty = sample.empty
+        self._last_marked = time.time()
+
+    def read_intersecting(self, geom, columns=None):
+        """
+        Read the candidate ATS features for a geometry given in the layer CRS.
+        The R-tree narrows the read to features whose bounding box overlaps the
+        geometry's. GDAL only guarantees that bounding-box filter, so callers
+        must still check intersects themselves (important for long diagonal
+        corridors, whose box covers far more than the footprint).
+        """
+        import geopandas as gpd
+
+        # A long-running worker keeps its extraction marked as in use.
+        if time.time() - self._last_marked > ATS_MARK_USED_INTERVAL_SECONDS:
+            self._last_marked = time.time()
+            _mark_ats_extraction_used(self.path.parent)
+
+        return gpd.read_file(self.path, mask=geom, columns=columns)
+
+
+def encode_ats(mer, rge, twp, sec=0, qs=""):
+    """Pack an ATS location into a single integer code (see ATS_QUARTER_CODES above)."""
+    qs_code = ATS_QUARTER_CODES.get(str(qs or "").strip().upper(), 0)
+    return (((int(mer) * 100 + int(rge)) * 1000 + int(twp)) * 100 + int(sec)) * 10 + qs_code
+
+
+def format_ats_codes(codes):
+    """ATS labels like SW-12-076-06-W5 for a NumPy array of ATS codes."""
+    codes = np.asarray(codes, dtype="int64")
+    qs = pd.Series(codes % 10).map(ATS_QUARTER_NAMES).fillna("")
+    sec = pd.Series(codes // 10 % 100).astype(str).str.zfill(2)
+    twp = pd.Series(codes // 1000 % 1000).astype(str).str.zfill(3)
+    rge = pd.Series(codes // 1000000 % 100).astype(str).str.zfill(2)
+    mer = pd.Series(codes // 100000000).astype(str)
+    prefix = qs.where(qs == "", qs + "-")
+    return (prefix + sec + "-" + twp + "-" + rge + "-W" + mer).to_numpy(dtype=object)
+
+
+def parse_ats_text(text):
+    """Parse typed ATS text such as NE-20-48-11-W5 or 20-48-11-W5 into an ATS code, or None."""
+    match = ATS_TEXT_PATTERN.match(str(text).strip())
+    if not match:
+        return None
+    qs, sec, twp, rge, mer = match.groups()
+    return encode_ats(mer, rge, twp, sec, qs)
+
+
+def ats_code_to_p3(code):
+    """P3 map search number MRRTTT for an ATS code."""
+    return f"{int(code) // 1000:06d}"
+
+
+def open_ats_layer():
+    """
+    Loads the Alberta ATS layer from ATS/ATS_QRT.zip in the repo.
+    Supports either a GeoPackage (.gpkg) or shapefile (.shp) inside the ZIP.
+
+    Returns:
+        ats_layer (AtsLayer), path_used, error_message
+    """
+    ats_zip_path = find_ats_zip_path()
+
+    if not ats_zip_path.exists():
+        return (
+            None,
+            str(ats_zip_path),
+            f"ATS zip not found. Looking in {ATS_LAYER_FOLDER}. Files seen: {get_ats_folder_files()}"
+        )
+
+    try:
+        file_size = ats_zip_path.stat().st_size
+
+        # If Streamlit/GitHub did not pull the real Git LFS object, it may only see a tiny text pointer file.
+        try:
+            with open(ats_zip_path, "rb") as f:
+                first_bytes = f.read(200)
+            if b"git-lfs.github.com/spec" in first_bytes:
+                return (
+                    None,
+                    str(ats_zip_path),
+                    f"Git LFS pointer file detected instead of real zip. File size seen by Streamlit: {file_size} bytes. "
+                    "Reboot/redeploy Streamlit after confirming Git LFS is enabled and the file uploaded."
+                )
+        except Exception:
+            pass
+
+        if not zipfile.is_zipfile(ats_zip_path):
+            return (
+                None,
+                str(ats_zip_path),
+                f"File exists but is not a readable zip. File size: {file_size} bytes. Files in ATS folder: {get_ats_folder_files()}"
+            )
+
+        extract_dir = extract_ats_zip(ats_zip_path)
+
+        prepared_path = extract_dir / ATS_PREPARED_NAME
+        if prepared_path.exists():
+            return AtsLayer(prepared_path), str(prepared_path), ""
+
+        # Your ATS_QRT.zip currently contains ATS_QRT.gpkg, so read .gpkg first.
+        # Prepared copies from older app versions sit in the same folder; never treat them as the source.
+        gpkg_files = sorted(p for p in extract_dir.rglob("*.gpkg") if not p.name.startswith("ATS_PREPARED"))
+        shp_files = sorted(extract_dir.rglob("*.shp"))
+
+        if gpkg_files:
+            ats_path = gpkg_files[0]
+        elif shp_files:
+            ats_path = shp_files[0]
+        else:
+            found_files = sorted([str(p.relative_to(extract_dir)) for p in extract_dir.rglob("*") if p.is_file()])[:20]
+            return (
+                None,
+                str(ats_zip_path),
+                f"No .gpkg or .shp found inside {ats_zip_path.name}. Files seen: {found_files}"
+            )
+
+        prepare_ats_layer(ats_path, prepared_path)
+        return AtsLayer(prepared_path), str(prepared_path), ""
+
+    except Exception as e:
+        return None, str(ats_zip_path), f"{type(e).__name__}: {e}"
+
+
+def _column_text(frame, field):
+    """A field as stripped strings, with NaN/None/empty values as ""."""
+    if not field:
+        return pd.Series("", index=frame.index, dtype="string")
+    return frame[field].astype("string").str.strip().fillna("")
+
+
+def _number_series(text, width):
+    """First number in each value, zero-padded to `width`; values without a number are kept as-is."""
+    digits = text.str.extract(r"(\d+)", expand=False)
+    return digits.str.zfill(width).fillna(text)
+
+
+def _meridian_series(text):
+    """Meridian as W5, W6, etc."""
+    text = text.str.upper().str.replace(" ", "", regex=False)
+    with_w = ("W" + text.str.extract(r"(\d+)", expand=False)).fillna(text)
+    return text.where(text.str.startswith("W") | (text == ""), with_w)
+
+
+def _quarter_series(text):
+    """Quarter section text like NE/SW, or blank if missing."""
+    text = text.str.upper().str.replace(" ", "", regex=False)
+    return text.mask(text.isin(["NAN", "NONE", "NULL", "0", "-"]), "")
+
+
+def format_ats_labels(frame, fields):
+    """
+    Build ATS labels like SW-12-076-06-W5 for every row of an ATS frame at once,
+    using pandas string ops instead of a row loop. Rows missing a section,
+    township, range or meridian fall back to the layer's own label field.
+    """
+    sec = _number_series(_column_text(frame, fields.get("sec")), 2)
+    twp = _number_series(_column_text(frame, fields.get("twp")), 3)
+    rge = _number_series(_column_text(frame, fields.get("rge")), 2)
+    mer = _meridian_series(_column_text(frame, fields.get("m")))
+    qs = _quarter_series(_column_text(frame, fields.get("qs")))
+
+    complete = (sec != "") & (twp != "") & (rge != "") & (mer != "")
+    prefix = qs.where(qs == "", qs + "-")
+    labels = prefix + sec + "-" + twp + "-" + rge + "-" + mer
+
+    return labels.where(complete, _column_text(frame, fields.get("label")))
+
+
+def _find_ats_fields(frame):
+    """Locate the ATS label component fields, ignoring case."""
+    return {
+        "qs": _find_field(frame, ["QS", "QTR", "QUARTER", "QUARTERSEC"]),
+        "sec": _find_field(frame, ["SEC", "SECTION"]),
+        "twp": _find_field(frame, ["TWP", "TOWNSHIP"]),
+        "rge": _find_field(frame, ["RGE", "RANGE"]),
+        "m": _find_field(frame, ["M", "MER", "MERIDIAN"]),
+        "label": _find_field(frame, ["Label", "LABEL", "ATS", "ATS_LABEL"]),
+    }
+
+
+def _first_int_series(text):
+    """First number in each value as an integer, 0 when there is none."""
+    digits = text.str.extract(r"(\d+)", expand=False)
+    return pd.to_numeric(digits, errors="coerce").fillna(0).astype("int64").to_numpy()
+
+
+def encode_ats_frame(frame, fields):
+    """
+    ATS codes for every row of an ATS frame, 0 where a row cannot be packed
+    (missing parts, values too wide, or a quarter other than NE/NW/SE/SW).
+    """
+    mer = _first_int_series(_column_text(frame, fields.get("m")))
+    rge = _first_int_series(_column_text(frame, fields.get("rge")))
+    twp = _first_int_series(_column_text(frame, fields.get("twp")))
+    sec = _first_int_series(_column_text(frame, fields.get("sec")))
+    qs = _quarter_series(_column_text(frame, fields.get("qs")))
+    qs_code = qs.map(ATS_QUARTER_CODES).fillna(0).astype("int64").to_numpy()
+
+    codes = (((mer * 100 + rge) * 1000 + twp) * 100 + sec) * 10 + qs_code
+    packable = (
+        (mer > 0) & (mer < 10)
+        & (rge > 0) & (rge < 100)
+        & (twp > 0) & (twp < 1000)
+        & (sec > 0) & (sec < 100)
+        & ((qs == "") | (qs_code > 0)).to_numpy()
+    )
+    return np.where(packable, codes, 0)
+
+
+def prepare_ats_layer(source_path, prepared_path):
+    """
+    Writes the slim ATS layer used for queries: geometry, the packed
+    ATS_CODE, and the finished ATS_LABEL. Rows whose label cannot be
+    rebuilt from a code keep ATS_CODE = 0 and rely on ATS_LABEL. Field
+    discovery and label formatting run here once per ATS zip instead of on
+    every footprint.
+    """
+    import geopandas as gpd
+
+    ats = gpd.read_file(source_path)
+    fields = _find_ats_fields(ats)
+
+    labels = format_ats_labels(ats, fields).astype(str).to_numpy()
+    codes = encode_ats_frame(ats, fields)
+    # Only trust a code when it round-trips to exactly the label the layer would have produced.
+    codes = np.where(format_ats_codes(codes) == labels, codes, 0)
+
+    prepared = gpd.GeoDataFrame(
+        {"ATS_CODE": codes, "ATS_LABEL": labels},
+        geometry=ats.geometry.values,
+        crs=ats.crs,
+    )
+
+    for old_prepared in prepared_path.parent.glob("ATS_PREPARED_*.gpkg"):
+        if old_prepared != prepared_path:
+            old_prepared.unlink(missing_ok=True)
+
+    # Write beside the target and rename, so other workers never open a half-written file.
+    staging_path = prepared_path.with_name(f".{prepared_path.stem}-{os.getpid()}.gpkg")
+    try:
+        prepared.to_file(staging_path, driver="GPKG", layer="ATS_PREPARED")
+        os.replace(staging_path, prepared_path)
+    finally:
+        staging_path.unlink(missing_ok=True)
+
+
+def get_ats_intersections(project_gdf, ats_layer):
+    """
+    Returns all ATS quarter/section labels intersected by the uploaded project shapefile.
+    """
+    empty_result = {
+        "ats_list": [],
+        "ats_text": "",
+        "count": 0,
+        "confidence": "Not found"
+    }
+
+    if ats_layer is None or ats_layer.empty:
+        empty_result["confidence"] = "ATS layer missing"
+        return empty_result
+
+    if project_gdf is None or project_gdf.empty:
+        empty_result["confidence"] = "Uploaded layer empty"
+        return empty_result
+
+    if project_gdf.crs is None:
+        empty_result["confidence"] = "Uploaded layer CRS missing"
+        return empty_result
+
+    if ats_layer.crs is None:
+        empty_result["confidence"] = "ATS layer CRS missing"
+        return empty_result
+
+    try:
+        project = _clean_geometries(project_gdf)
+        if project.empty:
+            empty_result["confidence"] = "No valid project geometry"
+            return empty_result
+
+        # Reproject the uploaded footprint into the ATS CRS instead of reprojecting all ATS polygons.
+        if project.crs != ats_layer.crs:
+            project = project.to_crs(ats_layer.crs)
+
+        project_geom = _safe_union(project.geometry)
+
+        # Spatially filtered read straight from the layer file; only the precomputed code/label is needed.
+        candidates = ats_layer.read_intersecting(project_geom, columns=["ATS_CODE", "ATS_LABEL"])
+
+        if candidates.empty:
+            empty_result["confidence"] = "No ATS overlap"
+            return empty_result
+
+        # Confirm actual intersection for all candidates in one predicate call.
+        hits = candidates[candidates.geometry.intersects(project_geom).to_numpy()]
+
+        # Sort and de-duplicate as integers; rows without a code fall back to their stored label.
+        codes = hits["ATS_CODE"].to_numpy()
+        uncoded = hits["ATS_LABEL"][codes == 0].fillna("")
+        ats_values = list(format_ats_codes(np.unique(codes[codes > 0])))
+        ats_values += sorted(set(uncoded[uncoded != ""]))
+
+        if not ats_values:
+            empty_result["confidence"] = "ATS fields missing or unreadable"
+            return empty_result
+
+        ats_text = ", ".join(ats_values)
+        return {
+            "ats_list": ats_values,
+            "ats_text": ats_text,
+            "count": len(ats_values),
+            "confidence": "ATS found"
+        }
+
+    except Exception as e:
+        empty_result["confidence"] = f"Error: {e}"
+        return empty_result
+
+
+# --- Footprint processing ---
+FOOTPRINT_STAGES = ("extract", "clean", "union", "region", "ATS", "write")
+
+
+class FootprintCancelled(Exception):
+    """Raised from an on_stage callback to stop process_footprint_zip between stages."""
+
+
+def process_footprint_zip(
+    zip_name, zip_bytes, natural_regions_store, ats_layer, project_code, add_date_text, on_stage=None
+):
+    """
+    Dissolve the shapefile in one uploaded zip into a single polygon and look up its Area_ha, Region and ATS.
+
+    Returns a dict with the sidebar messages as (level, text) pairs, the processing log lines,
+    area_ha/region/ats for autofill, and the output shapefile parts as {relative path: bytes}.
+    Errors are reported in the messages and log rather than raised.
+
+    on_stage(stage) is called as each of FOOTPRINT_STAGES starts; it may raise FootprintCancelled.
+    """
+    import geopandas as gpd
+
+    stem = Path(zip_name).stem
+    result = {
+        "name": zip_name,
+        "messages": [],
+        "log": [f"Processing {zip_name}..."],
+        "area_ha": 0.0,
+        "region": "",
+        "ats": "",
+        "files": {}
+    }
+
+    def report(level, text):
+        result["log"].append(text)
+        result["messages"].append((level, text))
+
+    def stage(name):
+        if on_stage is not None:
+            on_stage(name)
+
+    try:
+        stage("extract")
+        # Shapefiles at the top level of the zip, read straight from the uploaded bytes.
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            shapefiles = [
+                name for name in z.namelist()
+                if "/" not in name.rstrip("/") and name.lower().endswith(".shp")
+            ]
+        result["log"].append(f"Opened {zip_name} in memory")
+
+        if not shapefiles:
+            report("warning", f"No shapefiles found in {zip_name}, skipping.")
+            return result
+
+        if len(shapefiles) > 1:
+            report("warning", f"Warning: Multiple shapefiles found. Using: {shapefiles[0]}")
+
+        # READ FILE (each shapefile in a zip is a layer named after it)
+        gdf = gpd.read_file(io.BytesIO(zip_bytes), layer=Path(shapefiles[0]).stem)
+        result["log"].append(f"Loaded shapefile: {shapefiles[0]}")
+
+        if gdf.empty:
+            report("warning", "Uploaded shapefile is empty.")
+            return result
+
+        if not gdf.geometry.type.str.contains("Polygon|MultiPolygon").any():
+            report("warning", "No polygon geometries found.")
+            return result
+
+        # SPLIT MULTIPART + CLEAN GEOMETRY
+        stage("clean")
+        gdf = gdf.explode(ignore_index=True)
+        gdf = _clean_geometries(gdf)
+
+        if gdf.empty:
+            report("warning", "No valid geometries after cleaning.")
+            return result
+
+        # --- UPDATED: merge ALL features into ONE polygon feature (dissolve internal boundaries) ---
+        stage("union")
+        dissolved_geom = _safe_union(gdf.geometry)
+        dissolved_gdf = gpd.GeoDataFrame(geometry=[dissolved_geom], crs=gdf.crs)
+
+        # ADD AREA_HA TO FINAL DISSOLVED OUTPUT
+        try:
+            if dissolved_gdf.crs is None:
+                dissolved_gdf["Area_ha"] = 0
+                report("warning", "CRS missing — Area_ha and region lookup may be incorrect.")
+            else:
+                if getattr(dissolved_gdf.crs, "is_geographic", False):
+                    dissolved_area_gdf = dissolved_gdf.to_crs(epsg=3347)
+                else:
+                    dissolved_area_gdf = dissolved_gdf
+
+                dissolved_gdf["Area_ha"] = (dissolved_area_gdf.geometry.area / 10000).round(4)
+                result["log"].append("Area_ha field added successfully.")
+        except Exception as e:
+            dissolved_gdf["Area_ha"] = 0
+            report("warning", f"Error calculating Area_ha: {str(e)}")
+
+        try:
+            result["area_ha"] = float(dissolved_gdf["Area_ha"].iloc[0])
+        except Exception:
+            result["area_ha"] = 0.0
+
+        # --- Natural Region lookup from Alberta Natural Regions layer ---
+        # Keep sidebar display simple and only write the simplified Region field to output.
+        stage("region")
+        region_result = get_natural_region_overlap(dissolved_gdf, natural_regions_store)
+        region_text = str(region_result["tda_region"]).strip()
+
+        if not region_text:
+            region_text = "Not detected"
+
+        dissolved_gdf["Region"] = region_text
+        result["region"] = region_text
+        result["messages"].append(("success", f"Region: {region_text}"))
+
+        result["log"].append(
+            f"Region: {region_text}; "
+            f"Raw NRNAME: {region_result['region_raw']}; "
+            f"Subregion: {region_result['subregion_raw']}; "
+            f"Overlap ha: {region_result['overlap_ha']}; "
+            f"Confidence: {region_result['confidence']}"
+        )
+
+        # --- ATS lookup from Alberta ATS layer ---
+        stage("ATS")
+        ats_result = get_ats_intersections(dissolved_gdf, ats_layer)
+        ats_text = str(ats_result["ats_text"]).strip()
+
+        if not ats_text:
+            ats_text = "Not detected"
+
+        # Shapefile text fields can truncate long strings, so the processing log keeps the full list too.
+        dissolved_gdf["ATS"] = ats_text[:254]
+        result["ats"] = ats_text
+        result["messages"].append(("success", f"ATS: {ats_text}"))
+
+        result["log"].append(
+            f"ATS: {ats_text}; "
+            f"ATS count: {ats_result['count']}; "
+            f"Confidence: {ats_result['confidence']}"
+        )
+
+        # --- add required attribute fields to the single output feature ---
+        stage("write")
+        dissolved_gdf["Add_Date"] = add_date_text
+        dissolved_gdf["Status"] = "1"
+        dissolved_gdf["Project_Co"] = str(project_code).strip()
+
+        out_name = f"{stem}_singlepolygon"
+        parts = _shapefile_parts(dissolved_gdf, out_name)
+        result["files"] = {f"{stem}/{name}": data for name, data in parts.items()}
+        report("success", f"✅ Saved shapefile: {stem}/{out_name}.shp")
+
+    except FootprintCancelled:
+        raise
+
+    except Exception as e:
+        report("error", f"Error processing {zip_name}: {str(e)}")
+
+    return result
+
+
+def _shapefile_parts(gdf, name):
+    """
+    Write gdf as {name}.shp and return the .shp/.shx/.dbf/.prj/.cpg parts as {file name: bytes}.
+    GDAL can't write a multi-file shapefile to memory, so this goes through a scratch dir.
+    """
+    out_dir = scratch_dir("shapefile-")
+    try:
+        gdf.to_file(out_dir / f"{name}.shp")
+        return {p.name: p.read_bytes() for p in sorted(out_dir.iterdir())}
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def footprint_layers_key(*paths):
+    """(path, mtime, size) for each reference layer that exists, so replacing a layer invalidates results."""
+    return tuple(
+        _layer_cache_key(path) if path is not None and Path(path).exists() else None
+        for path in paths
+    )
+
+
+# --- Reference layer warm-up ---
+class LayerWarmup:
+    """
+    Runs the reference layer loaders on a background thread.
+
+    Each loader returns (layer, path, error) like open_ats_layer(). They run
+    in the order given, and result(name) stays None until that loader has
+    finished, so callers can show a loading state instead of waiting.
+    """
+
+    def __init__(self, **loaders):
+        self._loaders = loaders
+        self._results = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        self.started = time.time()
+        threading.Thread(target=self._run, name="layer-warmup", daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            for name, loader in self._loaders.items():
+                try:
+                    result = loader()
+                except Exception as e:
+                    result = (None, "", f"{type(e).__name__}: {e}")
+                with self._lock:
+                    self._results[name] = result
+        finally:
+            self.finished = time.time()
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started if self.started else 0.0
+
+    def result(self, name):
+        with self._lock:
+            return self._results.get(name)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+# --- Processed footprint cache ---
+class FootprintCache:
+    """
+    Thread-safe LRU of process_footprint_zip results, keyed on footprint_cache_key().
+    One instance is shared by every session on the server.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+
+def footprint_cache_key(zip_bytes, zip_name, project_code, add_date_text, layers_key):
+    """The zip's SHA-256 plus everything else that ends up in the result."""
+    return hashlib.sha256(zip_bytes).hexdigest(), zip_name, project_code, add_date_text, layers_key
+
+
+# --- Parallel footprint processing ---
+FOOTPRINT_WORKERS = int(os.environ.get("TIMBER_FOOTPRINT_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Set in each worker process by _init_footprint_worker.
+_worker_regions = None
+_worker_ats = None
+_worker_stage_queue = None
+
+
+def _init_footprint_worker(regions_path, ats_path, stage_queue):
+    global _worker_regions, _worker_ats, _worker_stage_queue
+    _worker_stage_queue = stage_queue
+    # The layers are optional; a missing one just gives "Not detected" results, as in the app.
+    try:
+        _worker_regions = read_natural_regions_store(regions_path) if regions_path else None
+    except Exception:
+        _worker_regions = None
+    try:
+        _worker_ats = AtsLayer(ats_path) if ats_path else None
+    except Exception:
+        _worker_ats = None
+
+
+def _process_in_worker(task_id, zip_name, zip_bytes, project_code, add_date_text):
+    def on_stage(stage):
+        _worker_stage_queue.put((task_id, stage))
+
+    return process_footprint_zip(
+        zip_name, zip_bytes, _worker_regions, _worker_ats, project_code, add_date_text, on_stage=on_stage
+    )
+
+
+class FootprintPool:
+    """
+    Worker processes for process_footprint_zip. Each worker loads the Natural Regions
+    store and opens the ATS layer once at start-up and reuses them for every zip.
+    Workers report stages on a queue, which a thread here passes to each task's on_stage.
+
+    Workers are spawned, not forked, so they never inherit the server's threads and locks.
+    If a worker dies (e.g. an OOM kill) the executor is broken for good; the next submit
+    replaces it and raises BrokenProcessPool so the caller can run that zip itself.
+    """
+
+    def __init__(self, regions_path, ats_path, workers=FOOTPRINT_WORKERS):
+        self._context = multiprocessing.get_context("spawn")
+        self.workers = max(1, workers)
+        self._stage_queue = self._context.Queue()
+        self._stage_listeners = {}
+        self._initargs = (regions_path or None, ats_path or None, self._stage_queue)
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+        threading.Thread(target=self._forward_stages, daemon=True).start()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_footprint_worker,
+            initargs=self._initargs
+        )
+
+    def _replace_executor(self, broken):
+        with self._executor_lock:
+            # Another batch may have replaced it already.
+            if self._executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+
+    def _forward_stages(self):
+        while True:
+            item = self._stage_queue.get()
+            if item is None:
+                return
+            task_id, stage = item
+            listener = self._stage_listeners.get(task_id)
+            if listener is not None:
+                listener(stage)
+
+    def submit(self, zip_name, zip_bytes, project_code, add_date_text, on_stage=None):
+        """Start one zip; returns a Future for its result dict."""
+        task_id = uuid.uuid4().hex
+        if on_stage is not None:
+            self._stage_listeners[task_id] = on_stage
+        executor = self._executor
+        try:
+            future = executor.submit(_process_in_worker, task_id, zip_name, zip_bytes, project_code, add_date_text)
+        except BrokenProcessPool:
+            self._stage_listeners.pop(task_id, None)
+            self._replace_executor(executor)
+            raise
+        future.add_done_callback(lambda _: self._stage_listeners.pop(task_id, None))
+        return future
+
+    def shutdown(self):
+        with self._executor_lock:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._stage_queue.put(None)
+
+
+# --- Dissolver batches ---
+class FootprintJob:
+    """One uploaded zip in a DissolverBatch: its status, current stage, timing and result."""
+
+    def __init__(self, name, zip_bytes, key, result=None):
+        self.name = name
+        self.zip_bytes = zip_bytes
+        self.key = key
+        self.result = None
+        self.status = "queued"
+        self.stage = ""
+        self.started = None
+        self.finished = None
+        if result is not None:
+            self.finish(result, status="cached")
+
+    def mark_stage(self, stage):
+        if self.complete or self.status == "cancelled":
+            return  # a late message from a worker
+        if self.started is None:
+            self.started = time.time()
+        self.status = "running"
+        self.stage = stage
+
+    def finish(self, result, status=None):
+        if status is None:
+            if any(level == "error" for level, _ in result["messages"]):
+                status = "error"
+            elif not result["files"]:
+                status = "skipped"
+            else:
+                status = "done"
+        self.result = result
+        self.zip_bytes = None
+        self.status = status
+        self.stage = ""
+        self.finished = time.time()
+
+    def cancel(self):
+        self.zip_bytes = None
+        self.status = "cancelled"
+        self.stage = ""
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def complete(self):
+        return self.result is not None
+
+
+class DissolverBatch:
+    """
+    The dissolver run for one set of uploaded zips, processed on a background thread
+    so the page stays responsive. Cached results count as complete straight away; the
+    rest run in `pool` when there are several, otherwise one at a time in this process.
+
+    cancel() stops zips that haven't started (and in-process zips between stages);
+    zips already running in a worker finish and are kept.
+    """
+
+    def __init__(self, uploads, project_code, add_date_text, regions, ats_layer, cache, pool=None):
+        self.jobs = [FootprintJob(name, zip_bytes, key, cache.get(key)) for name, zip_bytes, key in uploads]
+        self.signature = tuple(job.key for job in self.jobs)
+        self.project_code = project_code
+        self.add_date_text = add_date_text
+        self.started = time.time()
+        self._regions = regions
+        self._ats_layer = ats_layer
+        self._cache = cache
+        self._pool = pool
+        self._futures = []
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        for future in self._futures:
+            future.cancel()
+
+    def _complete(self, job, result):
+        job.finish(result)
+        # Failures can be temporary (a layer still loading, a full disk); let the next upload retry.
+        if job.status != "error":
+            self._cache.put(job.key, result)
+
+    def _process_here(self, job):
+        def on_stage(stage):
+            if self._cancel.is_set():
+                raise FootprintCancelled()
+            job.mark_stage(stage)
+
+        try:
+            self._complete(job, process_footprint_zip(
+                job.name, job.zip_bytes, self._regions, self._ats_layer,
+                self.project_code, self.add_date_text, on_stage=on_stage
+            ))
+        except FootprintCancelled:
+            job.cancel()
+
+    def _run(self):
+        pending = [job for job in self.jobs if not job.complete]
+
+        if self._pool is None or len(pending) < 2:
+            for job in pending:
+                self._process_here(job)
+            return
+
+        submitted = []
+        for job in pending:
+            try:
+                future = self._pool.submit(
+                    job.name, job.zip_bytes, self.project_code, self.add_date_text, on_stage=job.mark_stage
+                )
+            except RuntimeError:
+                # The pool is broken (it is replaced for the next zip) or shut down; run this one here.
+                future = None
+            submitted.append((job, future))
+        self._futures = [future for _, future in submitted if future is not None]
+        if self._cancel.is_set():
+            self.cancel()
+
+        for job, future in submitted:
+            if future is None:
+                self._process_here(job)
+                continue
+            try:
+                self._complete(job, future.result())
+            except CancelledError:
+                job.cancel()
+            except Exception:
+                # A worker died; process this one here instead.
+                self._process_here(job)
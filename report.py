@@ -0,0 +1,382 @@
+"""
+Vegetation and Timber Salvage Information report.
+
+The layout lives in salvage_report_template.docx, a pre-styled Word file
+whose text holds {{field}} placeholders. ReportTemplate reads it once and
+fills a report by substituting escaped values straight into
+word/document.xml, so generating a report is a string fill and a zip copy
+rather than building the document run by run. The paragraph holding
+{{ctlr_type}} is repeated once per timber disposition entered.
+
+Kept free of Streamlit; avi_app.py caches the template with
+st.cache_resource and memoizes rendered bytes with st.cache_data.
+
+Bulk mode renders one report per row of a dispositions table, with each
+disposition's totals taken from the stands tagged with it in a stand
+layer, and zips them all (render_reports_zip). Large batches are spread
+over worker processes.
+"""
+import io
+import math
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import pandas as pd
+
+from avi_calc import ProjectTotals, StandLog, _find_field
+
+
+REPORT_TEMPLATE_PATH = Path(__file__).with_name("salvage_report_template.docx")
+DOCUMENT_PART = "word/document.xml"
+
+VEGETATION_TYPES = [
+    "Native grassland",
+    "Tame pasture",
+    "Cropland",
+    "Sparsely or non-vegetated",
+    "Cutblock - planted",
+    "Natural regeneration >2m",
+    "Treed wetland",
+    "Shrubby wetland",
+    "Grass or grass-like wetland",
+    "Native aspen parkland",
+    "Other (specify)"
+]
+
+DEFAULT_WAIVER_JUSTIFICATION = (
+    "Timber salvage is not considered economically viable, given that the estimated volume is below 0.5 truckloads."
+)
+
+CHECKED = "☒"
+UNCHECKED = "☐"
+
+_FIELD_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+
+
+def checkbox(checked):
+    return CHECKED if checked else UNCHECKED
+
+
+def vegetation_field(label):
+    """Template field for a vegetation checkbox, e.g. "Cutblock - planted" -> "veg_cutblock_planted"."""
+    return "veg_" + re.sub(r"[^a-z0-9]+", "_", label.lower()).strip("_")
+
+
+def report_filename(disposition):
+    return f"Timber_Damage_Assessment_{disposition if disposition.strip() else 'Report'}.docx"
+
+
+def _xml_text(value):
+    # Runs are plain <w:t> text: tabs and line breaks have to become their own elements.
+    text = escape(str(value)).replace("\r\n", "\n")
+    text = text.replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    return text.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
+
+
+def _fill(xml, fields):
+    return _FIELD_PATTERN.sub(lambda m: _xml_text(fields[m.group(1)]), xml)
+
+
+class ReportTemplate:
+    """A .docx template parsed once; render() returns a filled copy as bytes."""
+
+    def __init__(self, path=REPORT_TEMPLATE_PATH, repeat_field="ctlr_type"):
+        with zipfile.ZipFile(path) as source:
+            document_xml = source.read(DOCUMENT_PART).decode("utf-8")
+
+            # Every other part is copied unchanged, so zip it once and append the filled document to a copy.
+            base = io.BytesIO()
+            with zipfile.ZipFile(base, "w") as target:
+                for info in source.infolist():
+                    if info.filename != DOCUMENT_PART:
+                        target.writestr(info, source.read(info))
+            self._base = base.getvalue()
+
+        # Filled values may start or end with spaces.
+        document_xml = document_xml.replace("<w:t>", '<w:t xml:space="preserve">')
+
+        marker = document_xml.find("{{" + repeat_field + "}}")
+        if marker < 0:
+            self._head, self._row, self._tail = document_xml, "", ""
+        else:
+            start = max(document_xml.rfind("<w:p>", 0, marker), document_xml.rfind("<w:p ", 0, marker))
+            end = document_xml.index("</w:p>", marker) + len("</w:p>")
+            self._head, self._row, self._tail = document_xml[:start], document_xml[start:end], document_xml[end:]
+
+    def render(self, fields, rows=()):
+        """Fill the template. Each dict in `rows` adds one copy of the repeated paragraph."""
+        document_xml = "".join([
+            _fill(self._head, fields),
+            *(_fill(self._row, {**fields, **row}) for row in rows),
+            _fill(self._tail, fields),
+        ])
+
+        out = io.BytesIO(self._base)
+        with zipfile.ZipFile(out, "a") as target:
+            target.writestr(DOCUMENT_PART, document_xml, compress_type=zipfile.ZIP_DEFLATED)
+        return out.getvalue()
+
+
+def salvage_report_fields(
+    totals,
+    disposition,
+    legal_loc,
+    vegetation,
+    other_specify_details,
+    is_merch,
+    disposition_fma,
+    no_disposition_fma,
+    salvage_waiver,
+    justification
+):
+    """Template fields for one report, from the project totals (avi_calc.ProjectTotals) and the salvage form."""
+    # --- calculate grouped percentages ---
+    raw_con = totals.con_raw
+    raw_dec = totals.dec_raw
+    pct_con = totals.pct_con
+
+    # conifer splits
+    if raw_con > 0:
+        spruce_pct = int(round(totals.spruce_raw / raw_con * 100, 0))
+        pine_pct = int(round(totals.pine_raw / raw_con * 100, 0))
+        other_con_pct = int(round(100 - spruce_pct - pine_pct, 0))
+    else:
+        spruce_pct = pine_pct = other_con_pct = 0
+
+    # deciduous splits
+    if raw_dec > 0:
+        aspen_pct = int(round(totals.aspen_raw / raw_dec * 100, 0))
+        other_dec_pct = int(round(100 - aspen_pct, 0))
+    else:
+        aspen_pct = other_dec_pct = 0
+
+    show_other = "Other (specify)" in vegetation and bool(other_specify_details)
+
+    fields = {
+        "disposition": disposition,
+        "legal_loc": legal_loc,
+        "other_specify_sep": ": " if show_other else "",
+        "other_specify": other_specify_details if show_other else "",
+        # --- coniferous class checkboxes ---
+        "class_d": checkbox(pct_con < 30),
+        "class_c": checkbox(pct_con > 70),
+        "class_cd": checkbox(50 <= pct_con <= 70),
+        "class_dc": checkbox(30 <= pct_con < 50),
+        "merch_yes": checkbox(is_merch == "Yes"),
+        "merch_no": checkbox(is_merch == "No"),
+        # Round volume and load up to one decimal place
+        "c_vol": f"{math.ceil(totals.c_vol * 10) / 10:.1f}",
+        "c_load": f"{math.ceil(totals.c_load * 10) / 10:.1f}",
+        "d_vol": f"{math.ceil(totals.d_vol * 10) / 10:.1f}",
+        "d_load": f"{math.ceil(totals.d_load * 10) / 10:.1f}",
+        "spruce_pct": spruce_pct,
+        "pine_pct": pine_pct,
+        "other_con_pct": other_con_pct,
+        "aspen_pct": aspen_pct,
+        "other_dec_pct": other_dec_pct,
+        "no_disposition": checkbox(no_disposition_fma),
+        "disposition_fma": disposition_fma,
+        "waiver_yes": checkbox(salvage_waiver == "Yes"),
+        "waiver_no": checkbox(salvage_waiver == "No"),
+        "justification": justification if salvage_waiver == "Yes" else "",
+    }
+    for label in VEGETATION_TYPES:
+        fields[vegetation_field(label)] = checkbox(label in vegetation)
+    return fields
+
+
+def disposition_rows(ctlr_list):
+    """One repeated-paragraph row per coniferous/deciduous disposition that has something entered."""
+    return tuple(
+        {"ctlr_type": ctlr["type"], "ctlr_number_holder": ctlr["number_holder"]}
+        for ctlr in ctlr_list
+        if ctlr["type"].strip() or ctlr["number_holder"].strip()
+    )
+
+
+# --- Bulk reports ---
+# Report field -> accepted column names in a dispositions table, in order of preference.
+DISPOSITION_FIELD_ALIASES = {
+    "disposition": ["disposition", "disp", "disposition_no", "disp_no"],
+    "legal_loc": ["legal_loc", "legal_land_location", "legal_location", "legal"],
+    "vegetation": ["vegetation", "veg", "veg_types"],
+    "other_specify_details": ["other_specify", "other_specify_details", "veg_other"],
+    "is_merch": ["is_merch", "merch", "merchantable"],
+    "disposition_fma": ["disposition_fma", "fma", "fma_holder"],
+    "no_disposition_fma": ["no_disposition_fma", "no_fma", "no_disposition"],
+    "ctlr": ["ctlr", "dispositions", "timber_dispositions", "ctl"],
+    "salvage_waiver": ["salvage_waiver", "waiver"],
+    "justification": ["justification", "waiver_justification"],
+}
+
+# Column in the stand layer naming the disposition each stand belongs to.
+STAND_DISPOSITION_ALIASES = DISPOSITION_FIELD_ALIASES["disposition"]
+
+# Below this many reports rendering in-process is faster than starting workers.
+REPORT_PARALLEL_MIN = 500
+REPORT_WORKERS = int(os.environ.get("TIMBER_REPORT_WORKERS", min(4, os.cpu_count() or 1)))
+
+_TRUE_TEXT = {"yes", "y", "true", "1", "x"}
+
+
+def _text(value):
+    return "" if pd.isna(value) else str(value).strip()
+
+
+def _is_true(value):
+    return _text(value).lower() in _TRUE_TEXT
+
+
+def _split_list(value):
+    return [item.strip() for item in re.split(r"[;\n]", _text(value)) if item.strip()]
+
+
+def _parse_ctlr(value):
+    """Split "CTL: 123 Holder; DTL: 456 Holder" into the form's type / number & holder entries."""
+    entries = []
+    for item in _split_list(value):
+        disposition_type, _, number_holder = item.partition(":")
+        if not number_holder:
+            disposition_type, number_holder = "", disposition_type
+        entries.append({"type": disposition_type.strip(), "number_holder": number_holder.strip()})
+    return entries
+
+
+def read_disposition_table(table):
+    """
+    One salvage-form dict per row of a dispositions table (DataFrame).
+
+    Vegetation is either a "vegetation" column of types separated by ";", or
+    one yes/no column per type named after it (e.g. "Treed wetland" or
+    "veg_treed_wetland"). Timber dispositions go in one column as
+    "CTL: 123 Holder; DTL: 456 Holder". Rows without a disposition are
+    skipped; is_merch defaults to Yes and the waiver to No.
+    """
+    fields = {name: _find_field(table.columns, aliases) for name, aliases in DISPOSITION_FIELD_ALIASES.items()}
+    if fields["disposition"] is None:
+        raise ValueError(
+            "Dispositions table has no disposition column. Accepted names: "
+            + ", ".join(DISPOSITION_FIELD_ALIASES["disposition"])
+        )
+    vegetation_flags = {
+        label: _find_field(table.columns, [label, vegetation_field(label)]) for label in VEGETATION_TYPES
+    }
+
+    def value(row, name):
+        return row[fields[name]] if fields[name] is not None else None
+
+    forms = []
+    for _, row in table.iterrows():
+        disposition = _text(value(row, "disposition"))
+        if not disposition:
+            continue
+
+        listed = {item.lower() for item in _split_list(value(row, "vegetation"))}
+        vegetation = [
+            label for label in VEGETATION_TYPES
+            if label.lower() in listed or (vegetation_flags[label] is not None and _is_true(row[vegetation_flags[label]]))
+        ]
+
+        salvage_waiver = "Yes" if _is_true(value(row, "salvage_waiver")) else "No"
+        justification = _text(value(row, "justification"))
+        if salvage_waiver == "Yes" and not justification:
+            justification = DEFAULT_WAIVER_JUSTIFICATION
+
+        is_merch = value(row, "is_merch")
+        forms.append({
+            "disposition": disposition,
+            "legal_loc": _text(value(row, "legal_loc")),
+            "vegetation": vegetation,
+            "other_specify_details": _text(value(row, "other_specify_details")),
+            "is_merch": "Yes" if is_merch is None or _text(is_merch) == "" or _is_true(is_merch) else "No",
+            "disposition_fma": _text(value(row, "disposition_fma")),
+            "no_disposition_fma": _is_true(value(row, "no_disposition_fma")),
+            "ctlr_list": _parse_ctlr(value(row, "ctlr")),
+            "salvage_waiver": salvage_waiver,
+            "justification": justification,
+        })
+    return forms
+
+
+def stand_dispositions(stands):
+    """The disposition column of a stand table, as stripped text."""
+    field = _find_field(stands.columns, STAND_DISPOSITION_ALIASES)
+    if field is None:
+        raise ValueError(
+            "Stand table has no disposition field. Accepted names: " + ", ".join(STAND_DISPOSITION_ALIASES)
+        )
+    return stands[field].map(_text)
+
+
+def totals_by_disposition(stand_results, dispositions):
+    """
+    ProjectTotals per disposition for a calculate_avi_and_volumes_batch result.
+    `dispositions` is the disposition of each stand (stand_dispositions()), aligned with `stand_results`.
+    """
+    totals = {}
+    for disposition, stands in stand_results.groupby(dispositions.to_numpy(), sort=False):
+        log = StandLog(capacity=len(stands))
+        log.extend_frame(stands)
+        totals[disposition] = log.totals()
+    return totals
+
+
+def bulk_report_jobs(forms, totals):
+    """
+    (filename, fields, rows) for every disposition form; filenames are made unique.
+    A disposition with no stands in `totals` gets an empty (zero volume) report.
+    """
+    jobs = []
+    used = set()
+    for form in forms:
+        form = dict(form)
+        ctlr_list = form.pop("ctlr_list")
+        filename = report_filename(form["disposition"])
+        stem, number = filename[:-len(".docx")], 2
+        while filename.lower() in used:
+            filename = f"{stem}_{number}.docx"
+            number += 1
+        used.add(filename.lower())
+
+        fields = salvage_report_fields(totals.get(form["disposition"], ProjectTotals()), **form)
+        jobs.append((filename, fields, disposition_rows(ctlr_list)))
+    return jobs
+
+
+# Set in each worker process by _init_report_worker.
+_worker_template = None
+
+
+def _init_report_worker(template_path):
+    global _worker_template
+    _worker_template = ReportTemplate(template_path)
+
+
+def _render_in_worker(job):
+    _, fields, rows = job
+    return _worker_template.render(fields, rows)
+
+
+def render_reports_zip(jobs, template=None, workers=REPORT_WORKERS, template_path=REPORT_TEMPLATE_PATH):
+    """Render every (filename, fields, rows) job into one zip and return its bytes."""
+    if workers > 1 and len(jobs) >= REPORT_PARALLEL_MIN:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_init_report_worker, initargs=(str(template_path),)
+        ) as pool:
+            documents = list(pool.map(_render_in_worker, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        template = template or ReportTemplate(template_path)
+        documents = [template.render(fields, rows) for _, fields, rows in jobs]
+
+    out = io.BytesIO()
+    # The documents are already deflated zips; storing them avoids compressing twice.
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zipf:
+        for (filename, _, _), document in zip(jobs, documents):
+            zipf.writestr(filename, document)
+    return out.getvalue()
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from avi_batch import OUTPUT_COLUMNS, main
+
+
+def _write_stands(path, with_region=True):
+    stands = pd.DataFrame({
+        "SP1": ["SW", "aw"],
+        "SP1_PCT": [100, 70],
+        "SP2": ["", "Pb"],
+        "SP2_PCT": [0, 30],
+        "CROWN_DENS": [60, 40],
+        "HEIGHT": [20, 15],
+        "AREA_HA": [1.5, 2.0],
+    })
+    if with_region:
+        stands["REGION"] = ["Boreal", "Foothills"]
+    stands.to_csv(path, index=False)
+
+
+def test_csv_round_trip(tmp_path):
+    source = tmp_path / "stands.csv"
+    _write_stands(source)
+
+    assert main([str(source), "--workers", "1"]) == 0
+
+    result = pd.read_csv(tmp_path / "stands_volumes.csv")
+    assert list(result.columns[-len(OUTPUT_COLUMNS):]) == OUTPUT_COLUMNS
+    assert len(result) == 2
+    assert result["AVI"].tolist() == ["mC20Sw10", "mB15Aw7Pb3"]
+    assert (result["C_Load"] * 40).round(5).tolist() == result["C_Vol"].round(5).tolist()
+
+
+def test_region_from_option(tmp_path):
+    source = tmp_path / "stands.csv"
+    output = tmp_path / "out.csv"
+    _write_stands(source, with_region=False)
+
+    assert main([str(source), "-o", str(output), "--region", "Boreal", "--workers", "1"]) == 0
+    assert pd.read_csv(output)["AVI"].notna().all()
+
+
+def test_missing_region_exits_with_error(tmp_path, capsys):
+    source = tmp_path / "stands.csv"
+    _write_stands(source, with_region=False)
+
+    assert main([str(source), "--workers", "1"]) == 1
+    assert "region" in capsys.readouterr().err
+    assert not (tmp_path / "stands_volumes.csv").exists()
@@ -0,0 +1,140 @@
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from avi_calc import StandLog, calculate_avi_and_volumes, calculate_avi_and_volumes_batch
+
+
+# dom_sp, dom_pct, sec_sp, sec_pct, crown_density, avg_stand_height, area, region, is_merch
+STANDS = [
+    ("Sw", 100, "", 0, 60, 20, 1.5, "Boreal", "Yes"),
+    ("Sb", 70, "Aw", 30, 45, 12, 2.25, "Boreal", "No"),
+    ("P", 60, "Sw", 40, 80, 27, 0.75, "Foothills", "y"),
+    ("Aw", 100, "", 0, 25, 3, 4.0, "Foothills", "TRUE"),
+    ("Aw", 50, "Pb", 50, 55, 30, 1.0, "Boreal", 1),
+    ("Fb", 80, "Bw", 20, 35, 9, 3.3, "Boreal", False),
+    ("P", 40, "Aw", 60, 70, 18, 0.5, "Foothills", ""),
+    ("Sw", 80, np.nan, np.nan, 65, 22, 2.0, "Boreal", np.nan),
+    ("Aw", 90, None, None, 40, 15, 1.2, "Foothills", None),
+]
+COLUMNS = [
+    "dom_sp", "dom_pct", "sec_sp", "sec_pct", "crown_density", "avg_stand_height", "area", "region", "is_merch"
+]
+
+
+def _form_merch(value):
+    """The Yes/No the form would have shown for an is_merch cell."""
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value == "":
+        return "Yes"
+    return "Yes" if str(value).strip().lower() in {"yes", "y", "true", "1"} else "No"
+
+
+def _single(row):
+    dom_sp, dom_pct, sec_sp, sec_pct, crown, height, area, region, is_merch = row
+    return calculate_avi_and_volumes(
+        _form_merch(is_merch),
+        crown,
+        height,
+        dom_sp,
+        dom_pct,
+        sec_sp if isinstance(sec_sp, str) else "",
+        0 if sec_pct is None or (isinstance(sec_pct, float) and math.isnan(sec_pct)) else sec_pct,
+        area,
+        region,
+    )
+
+
+def _same(batch_value, single_value):
+    # A blank TDA cell gives NaN volumes on both paths; None is "no conifer volume".
+    if single_value is None:
+        single_value = np.nan
+    if isinstance(batch_value, float) and math.isnan(batch_value):
+        return math.isnan(single_value)
+    return batch_value == single_value
+
+
+def test_batch_matches_single_stand():
+    batch = calculate_avi_and_volumes_batch(pd.DataFrame(STANDS, columns=COLUMNS))
+
+    for row, (_, out) in zip(STANDS, batch.iterrows()):
+        single = _single(row)
+        assert out["AVI"] == single.avi_code
+        assert out["Group"] == single.group
+        for column, value in [
+            ("TDA_Total", single.total_val),
+            ("C_Vol_ha", single.c_vol_ha),
+            ("D_Vol_ha", single.d_vol_ha),
+            ("C_Vol", single.c_vol),
+            ("D_Vol", single.d_vol),
+            ("C_Load", single.c_load),
+            ("D_Load", single.d_load),
+        ]:
+            assert _same(out[column], value), (row, column, out[column], value)
+
+
+def test_blank_merch_defaults_to_yes():
+    batch = calculate_avi_and_volumes_batch(pd.DataFrame(STANDS, columns=COLUMNS))
+    assert batch["AVI"].iloc[-3:].str.startswith("m").all()
+
+
+def test_batch_without_merch_column_is_merchantable():
+    frame = pd.DataFrame(STANDS, columns=COLUMNS).drop(columns="is_merch")
+    assert calculate_avi_and_volumes_batch(frame)["AVI"].str.startswith("m").all()
+
+
+def test_extend_frame_reads_blank_attributes_as_zero():
+    batch = calculate_avi_and_volumes_batch(pd.DataFrame(STANDS, columns=COLUMNS))
+    batch.loc[0, ["dom_pct", "crown_density"]] = np.nan
+    batch.loc[3, "dom_pct"] = np.nan
+
+    log = StandLog()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        log.extend_frame(batch)
+
+    assert log[0]["dom_pct"] == 0
+    assert log[0]["crown_density"] == 0
+    assert log[7]["sec_sp"] == "" and log[7]["sec_pct"] == 0
+    assert log[8]["sec_sp"] == "" and log[8]["sec_pct"] == 0
+    assert [entry["is_merch"] for entry in log] == batch["AVI"].str.startswith("m").tolist()
+
+
+def test_totals_match_entry_by_entry_append():
+    batch = calculate_avi_and_volumes_batch(pd.DataFrame(STANDS, columns=COLUMNS))
+    batch.loc[3, "dom_pct"] = np.nan
+
+    bulk = StandLog()
+    bulk.extend_frame(batch)
+    one_by_one = StandLog()
+    for entry in bulk:
+        one_by_one.append(entry)
+
+    totals = bulk.totals()
+    assert totals == one_by_one.totals()
+    assert totals.entries == len(STANDS)
+    # Stand 3 is pure Aw with a blank cover, so it adds no aspen cover.
+    assert totals.aspen_raw == 30 + 50 + 60 + 90
+    assert min(totals.con_raw, totals.dec_raw, totals.spruce_raw, totals.pine_raw, totals.aspen_raw) >= 0
+
+
+def test_stand_log_edit_and_delete():
+    batch = calculate_avi_and_volumes_batch(pd.DataFrame(STANDS, columns=COLUMNS))
+    log = StandLog()
+    log.extend_frame(batch)
+    entries = list(log)
+
+    edited = dict(entries[1], dom_pct=60, sec_pct=40)
+    log[1] = edited
+    del log[-1]
+    del log[0]
+
+    assert len(log) == len(STANDS) - 2
+    assert log[0] == edited
+    assert list(log) == [edited] + entries[2:-1]
+
+    expected = StandLog()
+    for entry in list(log):
+        expected.append(entry)
+    assert log.totals() == expected.totals()
@@ -0,0 +1,62 @@
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import footprints
+from footprints import DissolverBatch, FootprintCache, FootprintPool
+
+
+def _result(name, level="success"):
+    return {"messages": [(level, name)], "files": {f"{name}/x.shp": b""} if level != "error" else {}, "log": []}
+
+
+def _run_batch(uploads, cache, pool=None):
+    batch = DissolverBatch(uploads, "P1", "20260101", None, None, cache, pool=pool).start()
+    batch._thread.join(timeout=10)
+    assert not batch.running
+    return batch
+
+
+def test_error_results_are_not_cached(monkeypatch):
+    def fake_process(zip_name, *args, **kwargs):
+        return _result(zip_name, "error" if zip_name == "bad.zip" else "success")
+
+    monkeypatch.setattr(footprints, "process_footprint_zip", fake_process)
+    cache = FootprintCache()
+    batch = _run_batch([("good.zip", b"1", "k-good"), ("bad.zip", b"2", "k-bad")], cache)
+
+    assert [job.status for job in batch.jobs] == ["done", "error"]
+    assert cache.get("k-good") is not None
+    assert cache.get("k-bad") is None
+
+
+class _BrokenPool:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+
+def test_batch_runs_zips_here_when_the_pool_is_broken(monkeypatch):
+    monkeypatch.setattr(footprints, "process_footprint_zip", lambda zip_name, *a, **k: _result(zip_name))
+    uploads = [(f"{i}.zip", b"x", f"k{i}") for i in range(3)]
+    batch = _run_batch(uploads, FootprintCache(), pool=_BrokenPool())
+
+    assert [job.status for job in batch.jobs] == ["done"] * 3
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_pool_replaces_executor_after_a_worker_is_killed():
+    pool = FootprintPool(None, None, workers=1)
+    try:
+        pid = pool._executor.submit(os.getpid).result(timeout=60)
+        os.kill(pid, signal.SIGKILL)
+        with pytest.raises(BrokenProcessPool):
+            pool._executor.submit(os.getpid).result(timeout=60)
+
+        with pytest.raises(BrokenProcessPool):
+            pool.submit("a.zip", b"", "P1", "20260101")
+
+        assert pool._executor.submit(os.getpid).result(timeout=60) != pid
+    finally:
+        pool.shutdown()
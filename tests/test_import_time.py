@@ -0,0 +1,81 @@
+"""
+Import-time budget for the modules a fresh app worker loads before the
+stand form can draw. Heavy dependencies must stay deferred to the code
+that reads layers or renders reports. avi_app.py itself is a Streamlit
+script, so its module-level imports are checked by parsing it.
+"""
+import ast
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFERRED_MODULES = ["geopandas", "shapely", "pyproj", "pyogrio", "docx", "openpyxl"]
+IMPORT_BUDGET_SECONDS = 2.0
+APP_MODULES = ["avi_calc", "footprints", "report", "workspace"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+""" % ", ".join(APP_MODULES)
+
+
+def _import_app_modules():
+    # A fresh interpreter, so nothing imported by pytest or other tests is counted.
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_app_modules_do_not_import_heavy_dependencies():
+    modules = set(_import_app_modules()["modules"])
+    loaded = [name for name in DEFERRED_MODULES if name in modules]
+    assert not loaded, f"Imported at module level: {loaded}"
+
+
+def test_app_modules_import_within_budget():
+    elapsed = _import_app_modules()["elapsed"]
+    assert elapsed < IMPORT_BUDGET_SECONDS, f"Importing the app modules took {elapsed:.2f} s"
+
+
+class _ModuleLevelImports(ast.NodeVisitor):
+    """Top-level package names imported when a module runs, skipping function bodies."""
+
+    def __init__(self):
+        self.names = set()
+
+    def visit_FunctionDef(self, node):
+        pass
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_Lambda = visit_FunctionDef
+
+    def visit_Import(self, node):
+        self.names.update(alias.name.split(".")[0] for alias in node.names)
+
+    def visit_ImportFrom(self, node):
+        if node.module and not node.level:
+            self.names.add(node.module.split(".")[0])
+
+
+def _avi_app_imports():
+    visitor = _ModuleLevelImports()
+    visitor.visit(ast.parse((REPO_ROOT / "avi_app.py").read_text(encoding="utf-8")))
+    return visitor.names
+
+
+def test_avi_app_does_not_import_heavy_dependencies():
+    loaded = [name for name in DEFERRED_MODULES if name in _avi_app_imports()]
+    assert not loaded, f"Imported at the top of avi_app.py: {loaded}"
+
+
+def test_avi_app_local_imports_are_budgeted():
+    local = {name for name in _avi_app_imports() if (REPO_ROOT / f"{name}.py").exists()}
+    assert local <= set(APP_MODULES), f"Add to APP_MODULES: {sorted(local - set(APP_MODULES))}"
@@ -0,0 +1,81 @@
+"""
+Scratch space for the Streamlit app.
+
+Uploads, dissolver output and reports are all kept in memory, so the only
+files written are the short-lived per-task directories from scratch_dir()
+(shapefiles have to be written to disk before they can be zipped). The
+task removes its directory; as a backstop for crashes and restarts, and
+for the per-session directories and tmp*/dissolved_output trees older
+versions left behind, anything under WORKSPACE_ROOT idle for longer than
+WORKSPACE_TTL_SECONDS is swept.
+
+Settings can be overridden with the TIMBER_WORKSPACE_DIR and
+TIMBER_WORKSPACE_TTL environment variables.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+WORKSPACE_ROOT = Path(os.environ.get("TIMBER_WORKSPACE_DIR", Path(tempfile.gettempdir()) / "timber_workspaces"))
+WORKSPACE_TTL_SECONDS = int(os.environ.get("TIMBER_WORKSPACE_TTL", 6 * 3600))
+SCRATCH_DIR_NAME = "_scratch"
+
+# Expired workspaces are swept at most this often per process.
+SWEEP_INTERVAL_SECONDS = 600
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _remove(path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def scratch_dir(prefix="task-", root=WORKSPACE_ROOT):
+    """A temporary directory for one task. The caller removes it; the TTL sweep catches any it misses."""
+    scratch_root = Path(root) / SCRATCH_DIR_NAME
+    scratch_root.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=prefix, dir=scratch_root))
+
+
+def _sweep_legacy_temp_dirs(now, ttl):
+    # Older versions left a tmpXXXX/dissolved_output tree in the system temp dir on every rerun.
+    for legacy_dir in Path(tempfile.gettempdir()).glob("tmp*"):
+        try:
+            if (legacy_dir / "dissolved_output").is_dir() and now - legacy_dir.stat().st_mtime > ttl:
+                shutil.rmtree(legacy_dir, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def sweep_expired(root=WORKSPACE_ROOT, ttl=WORKSPACE_TTL_SECONDS, force=False):
+    """Remove scratch dirs (and old session workspaces) idle for longer than `ttl` seconds."""
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep = now
+
+    root = Path(root)
+    if root.exists():
+        candidates = [p for p in root.iterdir() if p.name != SCRATCH_DIR_NAME]
+        scratch_root = root / SCRATCH_DIR_NAME
+        if scratch_root.exists():
+            candidates.extend(scratch_root.iterdir())
+
+        for path in candidates:
+            try:
+                if now - path.stat().st_mtime > ttl:
+                    _remove(path)
+            except OSError:
+                pass
+
+    _sweep_legacy_temp_dirs(now, ttl)